@@ -1,10 +1,34 @@
 from app.config import app, mongo
-from app.routes import restaurant_routes, hashtag_routes
+from app.routes import (restaurant_routes, hashtag_routes, review_routes, leaderboard_routes,
+                        upload_routes, image_routes, health_routes)
 from app.admin import init_admin
+from app.commands import register_commands
+from app.models.indexes import ensure_indexes, MissingIndexError
+from app.models.compression import init_compression
 
 # Register routes
 restaurant_routes.register_routes(app)
 hashtag_routes.register_routes(app)
+review_routes.register_routes(app)
+leaderboard_routes.register_routes(app)
+upload_routes.register_routes(app)
+image_routes.register_routes(app)
+health_routes.register_routes(app)
+
+# Compress JSON responses
+init_compression(app)
+
+# Create indexes. Without the required ones (e.g. unique hashtag names,
+# duplicates are not pre-checked) the app must not start.
+try:
+    ensure_indexes()
+except MissingIndexError:
+    raise
+except Exception as e:
+    print(f"Failed to create MongoDB indexes. Error: {str(e)}")
+
+# Register CLI commands
+register_commands(app)
 
 # Initialize admin
 init_admin(app, mongo) 
\ No newline at end of file
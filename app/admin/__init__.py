@@ -1,28 +1,61 @@
+import os
+import re
+import socket
+import pymongo
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+from flask import request, jsonify, url_for, flash, redirect
 from flask_admin import Admin, AdminIndexView, expose
+from flask_admin.actions import action
 from flask_admin.contrib.pymongo import ModelView
+from flask_admin.contrib.pymongo.filters import FilterEqual, FilterLike
+from flask_admin.helpers import get_redirect_target
+from werkzeug.datastructures import MultiDict
 from flask_admin.form import FileUploadField
 from wtforms import form, fields
-from wtforms.widgets import ListWidget, CheckboxInput, html_params
-from wtforms.validators import DataRequired
-from markupsafe import Markup
-from app.models.s3_utils import S3Uploader
-from app.models.utils import get_current_time
+from wtforms.widgets import html_params
+from wtforms.validators import DataRequired, ValidationError
+from markupsafe import Markup, escape
+from app.models.s3_utils import get_uploader
+from app.models.utils import get_current_time, merge_gallery, id_values
+from app.models.hashtag_cache import get_hashtag_names, invalidate_hashtag_cache
+from app.models.leaderboards import update_leaderboards, remove_from_leaderboards, rebuild_hashtag
+from app.models.catalog import catalog_changed
 from app.config import mongo
 
 admin = Admin(name='Restaurant Admin', template_mode='bootstrap4')
-s3_uploader = S3Uploader()
+s3_uploader = get_uploader()
+# Bulk edits run here so large selections don't hold a request open
+bulk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='admin-bulk')
+# Identifies this process on the jobs it queued
+BULK_JOB_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+# Queued or running jobs without a heartbeat for this long belong to a
+# process that is gone
+BULK_JOB_TIMEOUT = timedelta(minutes=10)
+
+def fail_stale_bulk_jobs():
+    """Mark bulk jobs whose process stopped as failed so their progress pages stop polling"""
+    return mongo.db.bulk_jobs.update_many(
+        {'status': {'$in': ['queued', 'running']}, 'heartbeatAt': {'$lt': datetime.utcnow() - BULK_JOB_TIMEOUT}},
+        {'$set': {'status': 'failed', 'error': 'Interrupted, the server stopped before the job finished'}}
+    ).modified_count
 
 # Add this new class for image preview widget
 class ImagePreviewWidget:
     def __call__(self, field, **kwargs):
         html = []
-        if field._urls:  # Show existing images
+        if field._urls:  # Show existing images, unchecked ones are removed on save
             html.append('<div class="existing-images">')
-            html.append('<label>Current Images:</label>')
+            html.append('<label>Current Images (uncheck to remove):</label>')
             html.append('<div class="image-preview">')
             for url in field._urls:
+                html.append('<label class="image-keep">')
+                html.append(f'<input type="checkbox" name="{field.name}-keep" value="{url}" checked>')
                 html.append(f'<img src="{url}" alt="Preview">')
+                html.append('</label>')
             html.append('</div>')
+            html.append(f'<input type="hidden" name="{field.name}-keep-sent" value="1">')
             html.append('</div>')
         
         # Add file input for new images
@@ -50,22 +83,48 @@ class MultipleFileField(fields.FileField):
     def _value(self):
         return self._urls if self._urls else []
 
-# Add this new class for custom widget
-class InlineCheckboxWidget(ListWidget):
+# Hashtag picker: renders only the selected hashtags plus a search box backed
+# by a paginated endpoint, so the form size does not grow with the catalog
+class HashtagPickerWidget:
     def __call__(self, field, **kwargs):
-        kwargs.setdefault('id', field.id)
+        names = get_hashtag_names()
+        search_url = url_for('.hashtag_search')
         html = [f'<div class="form-group"><label class="control-label">{field.label.text}</label>']
-        html.append('<div class="hashtag-wrapper">')
-        html.append('<div class="hashtag-grid">')
-        for subfield in field:
+        html.append(f'<div class="hashtag-wrapper hashtag-picker" data-field="{field.name}" '
+                    f'data-search-url="{search_url}">')
+        html.append('<div class="hashtag-grid hashtag-selected">')
+        for value in field.data or []:
             html.append('<div class="hashtag-item">')
-            html.append(f'<label class="checkbox-inline">{subfield()} {subfield.label.text}</label>')
+            html.append(f'<label class="checkbox-inline"><input type="checkbox" name="{field.name}" '
+                        f'value="{escape(value)}" checked> {escape(names.get(value, value))}</label>')
             html.append('</div>')
         html.append('</div>')
+        html.append('<input type="search" class="form-control hashtag-search" placeholder="Search hashtags...">')
+        html.append('<div class="hashtag-grid hashtag-results"></div>')
+        html.append('<button type="button" class="btn btn-sm btn-secondary hashtag-more" '
+                    'style="display: none">More</button>')
         html.append('</div>')
         html.append('</div>')
         return Markup(''.join(html))
 
+class HashtagPickerField(fields.SelectMultipleField):
+    widget = HashtagPickerWidget()
+
+    def __init__(self, label=None, validators=None, **kwargs):
+        super(HashtagPickerField, self).__init__(label, validators, choices=[], **kwargs)
+
+    def pre_validate(self, form):
+        names = get_hashtag_names()
+        unknown = [value for value in self.data or [] if value not in names]
+        if unknown:
+            # The cache may predate a hashtag created by another worker
+            found = {str(h['_id']) for h in mongo.db.hashtags.find({'_id': {'$in': id_values(unknown)}}, {'_id': 1})}
+            if found:
+                invalidate_hashtag_cache()
+            unknown = [value for value in unknown if value not in found]
+        if unknown:
+            raise ValidationError(f"Unknown hashtags: {', '.join(unknown)}")
+
 # Add LogoPreviewWidget after ImagePreviewWidget
 class LogoPreviewWidget:
     def __call__(self, field, **kwargs):
@@ -95,12 +154,6 @@ class AdminHomeView(AdminIndexView):
     def index(self):
         return self.render('admin/index.html')
 
-def get_hashtag_choices():
-    # Get all hashtags from MongoDB
-    hashtags = list(mongo.db.hashtags.find())
-    # Return list of tuples (id, name) for SelectMultipleField
-    return [(str(hashtag['_id']), hashtag['name']) for hashtag in hashtags]
-
 class RestaurantForm(form.Form):
     name = fields.StringField('Name', [DataRequired()])
     phone = fields.StringField('Phone', [DataRequired()])
@@ -112,18 +165,285 @@ class RestaurantForm(form.Form):
     url = fields.StringField('URL', [DataRequired()])
     latitude = fields.FloatField('Latitude', default=0)
     longitude = fields.FloatField('Longitude', default=0)
-    hashtags = fields.SelectMultipleField('Hashtags', 
-                                        choices=get_hashtag_choices,
-                                        widget=InlineCheckboxWidget(),
-                                        option_widget=CheckboxInput())
+    hashtags = HashtagPickerField('Hashtags')
     logo = LogoField('Logo')
     images = MultipleFileField('Images')
     menuImages = MultipleFileField('Menu Images')
+    # __v the form was loaded at, an edit only saves if it is still current
+    version = fields.HiddenField()
 
 class RestaurantsView(ModelView):
     column_list = ('name', 'phone', 'shortLocation', 'priceRange', 'rating')
     column_sortable_list = ('name', 'rating')
+    column_searchable_list = ('name',)
+    column_filters = (
+        FilterLike('shortLocation', 'Location'),
+        FilterEqual('priceRange', 'Price Range'),
+        FilterEqual('hashtags', 'Hashtag ID'),
+    )
     form = RestaurantForm
+    # Bulk operations run in the background in chunks of this many rows,
+    # recording progress after each one
+    bulk_chunk_size = 1000
+    # Fields fetched for the list view, documents can carry long descriptions
+    # and image galleries that the list never shows
+    list_projection = {column: 1 for column in column_list}
+    hashtag_page_size = 50
+
+    def _build_list_query(self, search, filters):
+        """Build the MongoDB query for the current search and filters"""
+        query = {}
+
+        if self._filters:
+            data = []
+            for flt, flt_name, value in filters:
+                f = self._filters[flt]
+                data = f.apply(data, f.clean(value))
+            if data:
+                if len(data) == 1:
+                    query = data[0]
+                else:
+                    query['$and'] = data
+
+        if self._search_supported and search:
+            query = self._search(query, search)
+
+        return query
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        """Same as ModelView.get_list, but only loads the listed columns"""
+        query = self._build_list_query(search, filters)
+
+        count = self.coll.count_documents(query) if not self.simple_list_pager else None
+
+        sort_by = None
+        if sort_column:
+            sort_by = [(sort_column, pymongo.DESCENDING if sort_desc else pymongo.ASCENDING)]
+        else:
+            order = self._get_default_order()
+            if order:
+                sort_by = [(col, pymongo.DESCENDING if desc else pymongo.ASCENDING)
+                           for (col, desc) in order]
+
+        if page_size is None:
+            page_size = self.page_size
+
+        skip = 0
+        if page and page_size:
+            skip = page * page_size
+
+        results = self.coll.find(query, self.list_projection, sort=sort_by,
+                                 skip=skip, limit=page_size)
+        if execute:
+            results = list(results)
+
+        return count, results
+
+    def _query_from_url(self, url):
+        """Rebuild the list view query from a list URL (search and filters)"""
+        args = MultiDict(parse_qsl(urlsplit(url).query))
+        filters = []
+        if self._filters:
+            for arg in args:
+                if not arg.startswith('flt') or '_' not in arg:
+                    continue
+                pos, key = arg[3:].split('_', 1)
+                if key in self._filter_args:
+                    idx, flt = self._filter_args[key]
+                    value = args[arg]
+                    if flt.validate(value):
+                        filters.append((pos, (idx, flt.name, value)))
+            filters = [f[1] for f in sorted(filters, key=lambda f: f[0])]
+        return self._build_list_query(args.get('search'), filters)
+
+    def _release_images(self, restaurants):
+        """Release all S3 objects of deleted restaurants, off the request path"""
+        urls = []
+        for restaurant in restaurants:
+            if restaurant.get('logo'):
+                urls.append(restaurant['logo'])
+            urls.extend(restaurant.get('images') or [])
+            urls.extend(restaurant.get('menuImages') or [])
+        s3_uploader.delete_files_async(urls)
+
+    def after_model_delete(self, model):
+        self._release_images([model])
+        remove_from_leaderboards(model)
+        catalog_changed()
+
+    @action('delete', 'Delete', 'Delete the selected restaurants and their images?')
+    def action_delete(self, ids):
+        try:
+            query = {'_id': {'$in': [self._get_valid_id(pk) for pk in ids]}}
+            count = self._bulk_delete(query)
+            catalog_changed()
+            flash(f'{count} restaurants were successfully deleted.', 'success')
+        except Exception as e:
+            flash(f'Failed to delete restaurants. {str(e)}', 'error')
+
+    @action('bulk_edit', 'Bulk edit')
+    def action_bulk_edit(self, ids):
+        return_url = get_redirect_target() or self.get_url('.index_view')
+        return self.render(
+            'admin/bulk_edit.html',
+            ids=ids,
+            filter_count=self.coll.count_documents(self._query_from_url(return_url)),
+            return_url=return_url
+        )
+
+    @expose('/bulk/', methods=['POST'])
+    def bulk_view(self):
+        """Start a bulk operation on the selected rows or the current filter"""
+        return_url = get_redirect_target() or self.get_url('.index_view')
+        operation = request.form.get('operation')
+
+        try:
+            update = None
+            hashtag_id = None
+            if operation in ('add_hashtag', 'remove_hashtag'):
+                hashtag = mongo.db.hashtags.find_one({'name': request.form.get('hashtag', '').strip()})
+                if not hashtag:
+                    flash('Hashtag not found.', 'error')
+                    return redirect(return_url)
+                hashtag_id = str(hashtag['_id'])
+                if operation == 'add_hashtag':
+                    update = {'$addToSet': {'hashtags': hashtag_id}}
+                else:
+                    update = {'$pull': {'hashtags': hashtag_id}}
+            elif operation == 'set_price_range':
+                price_range = request.form.get('priceRange')
+                if price_range not in ('$', '$$', '$$$'):
+                    flash('Invalid price range.', 'error')
+                    return redirect(return_url)
+                update = {'$set': {'priceRange': price_range}}
+            elif operation != 'delete':
+                flash('Unknown bulk operation.', 'error')
+                return redirect(return_url)
+
+            # Resolve the filter to ids up front: the update may change which
+            # rows match it, and chunks of ids give the job measurable progress
+            if request.form.get('scope') == 'filter':
+                ids = [r['_id'] for r in self.coll.find(self._query_from_url(return_url), {'_id': 1})]
+            else:
+                ids = [self._get_valid_id(pk) for pk in request.form.getlist('rowid')]
+
+            job = {
+                'operation': operation,
+                'status': 'queued',
+                'owner': BULK_JOB_OWNER,
+                'total': len(ids),
+                'processed': 0,
+                'modified': 0,
+                'createdAt': get_current_time(),
+                'heartbeatAt': datetime.utcnow()
+            }
+            mongo.db.bulk_jobs.insert_one(job)
+            bulk_executor.submit(self._run_bulk_job, job['_id'], ids, operation, update, hashtag_id)
+
+        except Exception as e:
+            print(f"Error in bulk_view: {str(e)}")
+            flash(f'Bulk operation failed. {str(e)}', 'error')
+            return redirect(return_url)
+
+        return redirect(self.get_url('.bulk_job_view', job_id=str(job['_id']), url=return_url))
+
+    def _run_bulk_job(self, job_id, ids, operation, update, hashtag_id):
+        """Apply a bulk operation chunk by chunk, recording progress on the job"""
+        jobs = mongo.db.bulk_jobs
+        started = jobs.update_one(
+            {'_id': job_id, 'status': 'queued'},
+            {'$set': {'status': 'running', 'heartbeatAt': datetime.utcnow()}}
+        )
+        if not started.modified_count:
+            return  # Given up on while it was waiting
+        modified = 0
+        try:
+            for start in range(0, len(ids), self.bulk_chunk_size):
+                query = {'_id': {'$in': ids[start:start + self.bulk_chunk_size]}}
+                if operation == 'delete':
+                    modified += self._bulk_delete(query)
+                else:
+                    chunk_update = {**update, '$inc': {'__v': 1}}
+                    chunk_update['$set'] = {**update.get('$set', {}), 'updatedAt': get_current_time()}
+                    modified += self.coll.update_many(query, chunk_update).modified_count
+                jobs.update_one({'_id': job_id}, {'$set': {
+                    'processed': min(start + self.bulk_chunk_size, len(ids)),
+                    'modified': modified,
+                    'heartbeatAt': datetime.utcnow()
+                }})
+                # Jobs waiting behind this one are alive as well
+                jobs.update_many({'owner': BULK_JOB_OWNER, 'status': 'queued'},
+                                 {'$set': {'heartbeatAt': datetime.utcnow()}})
+
+            if hashtag_id and modified:
+                rebuild_hashtag(hashtag_id)
+            if modified:
+                catalog_changed()
+            jobs.update_one({'_id': job_id}, {'$set': {'status': 'done', 'finishedAt': get_current_time()}})
+        except Exception as e:
+            print(f"Error in bulk job {job_id}: {str(e)}")
+            if modified:
+                catalog_changed()
+            jobs.update_one({'_id': job_id}, {'$set': {'status': 'failed', 'error': str(e)}})
+
+    @expose('/bulk/<job_id>/')
+    def bulk_job_view(self, job_id):
+        """Progress page of a bulk operation"""
+        return_url = get_redirect_target() or self.get_url('.index_view')
+        return self.render(
+            'admin/bulk_status.html',
+            status_url=self.get_url('.bulk_job_status', job_id=job_id),
+            return_url=return_url
+        )
+
+    @expose('/bulk/<job_id>/status/')
+    def bulk_job_status(self, job_id):
+        """Progress of a bulk operation, polled by the progress page"""
+        fail_stale_bulk_jobs()
+        job = mongo.db.bulk_jobs.find_one({'_id': self._get_valid_id(job_id)})
+        if not job:
+            return jsonify({'error': 'Bulk job not found'}), 404
+        return jsonify({
+            'operation': job['operation'],
+            'status': job['status'],
+            'total': job['total'],
+            'processed': job['processed'],
+            'modified': job['modified'],
+            'error': job.get('error')
+        })
+
+    def _bulk_delete(self, query):
+        """Delete matching restaurants and release their images"""
+        restaurants = list(self.coll.find(query, {'logo': 1, 'images': 1, 'menuImages': 1, 'hashtags': 1}))
+        if not restaurants:
+            return 0
+        result = self.coll.delete_many({'_id': {'$in': [r['_id'] for r in restaurants]}})
+        self._release_images(restaurants)
+        for hashtag in {h for r in restaurants for h in r.get('hashtags') or []}:
+            rebuild_hashtag(hashtag)
+        print(f"Bulk delete: {result.deleted_count} restaurants removed")
+        return result.deleted_count
+
+    @expose('/hashtag-search/')
+    def hashtag_search(self):
+        """Paginated hashtag lookup for the picker widget"""
+        search = request.args.get('q', '').strip()
+        page = max(request.args.get('page', 0, type=int), 0)
+
+        query = {}
+        if search:
+            query['name'] = {'$regex': f'^{re.escape(search)}', '$options': 'i'}
+
+        hashtags = list(mongo.db.hashtags.find(query, {'name': 1})
+                        .sort('name', pymongo.ASCENDING)
+                        .skip(page * self.hashtag_page_size)
+                        .limit(self.hashtag_page_size + 1))
+        return jsonify({
+            'results': [{'id': str(h['_id']), 'name': h['name']}
+                        for h in hashtags[:self.hashtag_page_size]],
+            'hasMore': len(hashtags) > self.hashtag_page_size
+        })
     
     def _handle_file_upload(self, file, folder, restaurant_name=None):
         """Handle file upload to S3"""
@@ -133,19 +453,6 @@ class RestaurantsView(ModelView):
             return file  # Return existing URL
         return s3_uploader.upload_file(file, folder, restaurant_name)
     
-    def edit_form(self, obj=None):
-        """Populate form with existing data when editing"""
-        form = super(RestaurantsView, self).edit_form(obj)
-        if obj:
-            # Show existing images in the form
-            if 'images' in obj and obj['images']:
-                print(f"Setting existing images: {obj['images']}")
-                form.images.process_data(obj['images'])
-            if 'menuImages' in obj and obj['menuImages']:
-                print(f"Setting existing menu images: {obj['menuImages']}")
-                form.menuImages.process_data(obj['menuImages'])
-        return form
-
     def on_model_change(self, form, model, is_created):
         try:
             # Get restaurant name for folder structure
@@ -162,49 +469,62 @@ class RestaurantsView(ModelView):
                 'latitude': float(model.get('latitude', 0)),
                 'longitude': float(model.get('longitude', 0)),
                 'hashtags': model.get('hashtags', []),
-                'rating': model.get('rating', 0),
-                'reviewCount': model.get('reviewCount', 0)
+                # Bumped on every save so API clients holding an older
+                # version get a 409 instead of overwriting this edit
+                '__v': 0 if is_created else self._form_version(form) + 1
             }
 
+            # Keep the primary key so the edit replaces the right document
+            if '_id' in model:
+                clean_model['_id'] = model['_id']
+
+            # Stored image fields, the form only carries newly uploaded files
+            previous = {}
+            if not is_created and model.get('_id') is not None:
+                previous = self.coll.find_one(
+                    {'_id': model['_id']},
+                    {'logo': 1, 'images': 1, 'menuImages': 1, 'hashtags': 1}
+                ) or {}
+            form._previous_hashtags = previous.get('hashtags') if previous else None
+            released_urls = []
+            form._uploaded_urls = uploaded_urls = []
+
             # Handle logo upload
-            if form.logo.data:
-                if isinstance(form.logo.data, str):
-                    clean_model['logo'] = form.logo.data
-                else:
-                    logo_url = self._handle_file_upload(form.logo.data, 'logos', restaurant_name)
-                    if logo_url:
-                        clean_model['logo'] = logo_url
-            
-            # Handle images upload
-            if form.images.data:
-                image_urls = []
-                if isinstance(form.images.data, list):
-                    for image in form.images.data:
-                        if isinstance(image, str):
-                            image_urls.append(image)
-                        elif image and hasattr(image, 'filename'):
-                            url = self._handle_file_upload(image, 'images', restaurant_name)
-                            if url:
-                                image_urls.append(url)
-                if image_urls:
-                    clean_model['images'] = image_urls
-            
-            # Handle menu images upload
-            if form.menuImages.data:
-                menu_urls = []
-                if isinstance(form.menuImages.data, list):
-                    for menu in form.menuImages.data:
-                        if isinstance(menu, str):
-                            menu_urls.append(menu)
-                        elif menu and hasattr(menu, 'filename'):
-                            url = self._handle_file_upload(menu, 'menus', restaurant_name)
-                            if url:
-                                menu_urls.append(url)
-                if menu_urls:
-                    clean_model['menuImages'] = menu_urls
-
-            # Set timestamps
+            if form.logo.data and not isinstance(form.logo.data, str):
+                logo_url = self._handle_file_upload(form.logo.data, 'logos', restaurant_name)
+                if logo_url:
+                    uploaded_urls.append(logo_url)
+                    clean_model['logo'] = logo_url
+                    if previous.get('logo'):
+                        released_urls.append(previous['logo'])
+            elif isinstance(form.logo.data, str) and form.logo.data:
+                clean_model['logo'] = form.logo.data
+            elif previous.get('logo'):
+                clean_model['logo'] = previous['logo']
+
+            # Handle images and menu images: checked previews are kept in
+            # order, new files are appended and only the difference touches S3
+            for field, folder in (('images', 'images'), ('menuImages', 'menus')):
+                files = getattr(form, field).data
+                new_files = [f for f in files if hasattr(f, 'filename') and f.filename] \
+                    if isinstance(files, list) else []
+                keep = None
+                if f'{field}-keep-sent' in request.form:
+                    keep = request.form.getlist(f'{field}-keep')
+                uploaded = [self._handle_file_upload(f, folder, restaurant_name) for f in new_files]
+                uploaded_urls.extend(url for url in uploaded if url)
+                gallery, released = merge_gallery(
+                    previous.get(field, []), keep, [url for url in uploaded if url]
+                )
+                if gallery:
+                    clean_model[field] = gallery
+                released_urls.extend(released)
+            form._released_urls = released_urls
+
+            # Set timestamps. Rating aggregates belong to the review routes,
+            # edits leave them alone (see update_model)
             if is_created:
+                clean_model.update({'rating': 0, 'ratingSum': 0, 'reviewCount': 0})
                 clean_model['createdAt'] = clean_model['updatedAt'] = get_current_time()
             else:
                 clean_model['updatedAt'] = get_current_time()
@@ -215,16 +535,68 @@ class RestaurantsView(ModelView):
                 
         except Exception as e:
             print(f"Error in on_model_change: {str(e)}")
+            s3_uploader.delete_files_async(getattr(form, '_uploaded_urls', []))
+            form._uploaded_urls = []
             raise
 
-    def create_form(self, obj=None):
-        form = super(RestaurantsView, self).create_form(obj)
-        form.hashtags.choices = get_hashtag_choices()
-        return form
+    def _form_version(self, form):
+        try:
+            return int(form.version.data or 0)
+        except ValueError:
+            return 0
+
+    def update_model(self, form, model):
+        """Save an edit only if the restaurant is still at the version the form was loaded at"""
+        try:
+            version = self._form_version(form)
+            model.update(form.data)
+            self._on_model_change(form, model, False)
+            # $set only the form's fields so concurrent review writes to the
+            # rating aggregates survive; images removed in the form are unset
+            fields_set = {key: value for key, value in model.items() if key != '_id'}
+            fields_unset = {field: '' for field in ('logo', 'images', 'menuImages') if field not in model}
+            update = {'$set': fields_set}
+            if fields_unset:
+                update['$unset'] = fields_unset
+            # Documents from before versioning have no __v, they count as 0
+            saved = self.coll.find_one_and_update(
+                {'_id': self.get_pk_value(model), '__v': version or {'$in': [0, None]}},
+                update,
+                return_document=pymongo.ReturnDocument.AFTER
+            )
+        except Exception as e:
+            s3_uploader.delete_files_async(getattr(form, '_uploaded_urls', []))
+            flash(f'Failed to update record. {str(e)}', 'error')
+            return False
+
+        if saved is None:
+            # Nothing was saved, give back the files uploaded for this edit
+            s3_uploader.delete_files_async(form._uploaded_urls)
+            flash('This restaurant was changed by someone else since you opened it. '
+                  'Reload the page and apply your changes again.', 'error')
+            return False
+
+        # Leaderboards need the stored rating aggregates
+        model.clear()
+        model.update(saved)
+        self.after_model_change(form, model, False)
+        return True
+
+    def after_model_change(self, form, model, is_created):
+        # Delete replaced objects only once the new document is saved
+        s3_uploader.delete_files_async(getattr(form, '_released_urls', []))
+        update_leaderboards(model, getattr(form, '_previous_hashtags', None))
+        catalog_changed()
 
     def edit_form(self, obj=None):
+        """Populate form with existing data when editing"""
         form = super(RestaurantsView, self).edit_form(obj)
-        form.hashtags.choices = get_hashtag_choices()
+        if obj:
+            # Show existing images in the form
+            form.images._urls = obj.get('images') or []
+            form.menuImages._urls = obj.get('menuImages') or []
+            if request.method == 'GET':
+                form.version.data = obj.get('__v', 0)
         return form
 
     def create_blueprint(self, admin):
@@ -269,6 +641,58 @@ class RestaurantsView(ModelView):
                         }
                     }
 
+                    // Hashtag picker: search and page through hashtags on the server
+                    document.querySelectorAll('.hashtag-picker').forEach(picker => {
+                        const field = picker.dataset.field;
+                        const selected = picker.querySelector('.hashtag-selected');
+                        const results = picker.querySelector('.hashtag-results');
+                        const search = picker.querySelector('.hashtag-search');
+                        const more = picker.querySelector('.hashtag-more');
+                        let page = 0;
+                        let timer = null;
+
+                        function isSelected(id) {
+                            return Array.from(selected.querySelectorAll('input'))
+                                .some(input => input.value === id);
+                        }
+
+                        function load(reset) {
+                            page = reset ? 0 : page + 1;
+                            const url = picker.dataset.searchUrl +
+                                '?q=' + encodeURIComponent(search.value) + '&page=' + page;
+                            fetch(url).then(response => response.json()).then(data => {
+                                if (reset) {
+                                    results.innerHTML = '';
+                                }
+                                data.results.filter(h => !isSelected(h.id)).forEach(h => {
+                                    const item = document.createElement('div');
+                                    item.className = 'hashtag-item';
+                                    const label = document.createElement('label');
+                                    label.className = 'checkbox-inline';
+                                    const input = document.createElement('input');
+                                    input.type = 'checkbox';
+                                    input.name = field;
+                                    input.value = h.id;
+                                    input.addEventListener('change', () => {
+                                        (input.checked ? selected : results).appendChild(item);
+                                    });
+                                    label.appendChild(input);
+                                    label.appendChild(document.createTextNode(' ' + h.name));
+                                    item.appendChild(label);
+                                    results.appendChild(item);
+                                });
+                                more.style.display = data.hasMore ? '' : 'none';
+                            });
+                        }
+
+                        search.addEventListener('input', () => {
+                            clearTimeout(timer);
+                            timer = setTimeout(() => load(true), 250);
+                        });
+                        more.addEventListener('click', () => load(false));
+                        load(true);
+                    });
+
                     // Add listeners to all file inputs
                     document.querySelectorAll('input[type="file"]').forEach(input => {
                         input.addEventListener('change', handleFileSelect);
@@ -341,6 +765,13 @@ class RestaurantsView(ModelView):
                     border-radius: 4px;
                     flex: 0 0 60px;
                 }
+                .image-keep {
+                    display: flex;
+                    flex-direction: column;
+                    align-items: center;
+                    margin: 0;
+                    cursor: pointer;
+                }
                 .existing-images {
                     margin-bottom: 10px;
                 }
@@ -362,10 +793,24 @@ class HashtagsView(ModelView):
     column_sortable_list = ('name',)
     form = HashtagForm
 
+    def after_model_change(self, form, model, is_created):
+        invalidate_hashtag_cache()
+        catalog_changed()
+
+    def after_model_delete(self, model):
+        invalidate_hashtag_cache()
+        catalog_changed()
+
 def init_admin(app, mongo):
     # Initialize admin with custom base template
     admin.init_app(app, index_view=AdminHomeView())
     
+    # Jobs of a process that was restarted are never picked up again
+    try:
+        fail_stale_bulk_jobs()
+    except Exception as e:
+        print(f"Failed to expire bulk jobs. Error: {str(e)}")
+
     # Add views with explicit endpoint names
     admin.add_view(RestaurantsView(mongo.db.restaurants, 'Restaurants', endpoint='restaurants'))
     admin.add_view(HashtagsView(mongo.db.hashtags, 'Hashtags', endpoint='hashtags')) 
\ No newline at end of file
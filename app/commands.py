@@ -0,0 +1,75 @@
+import click
+from datetime import timedelta
+from app.models.s3_gc import collect_garbage
+from app.models.reviews import reconcile_ratings
+from app.models.leaderboards import rebuild_all_leaderboards
+from app.models.catalog import publish_catalog, prune_catalog, CATALOG_SNAPSHOTS
+from app.models.s3_utils import get_uploader
+from app.models.uploads import process_pending_uploads
+
+def register_commands(app):
+    @app.cli.command('gc-images')
+    @click.option('--grace-hours', default=24, show_default=True,
+                  help='Only delete orphans older than this many hours')
+    @click.option('--dry-run/--delete', default=True, show_default=True,
+                  help='Report orphans without deleting them')
+    @click.option('--batches-per-second', default=1.0, show_default=True,
+                  help='Rate limit for delete_objects batches of 1000 keys')
+    @click.option('--force', is_flag=True,
+                  help='Run even if restaurants have images but none of them is in the bucket')
+    def gc_images(grace_hours, dry_run, batches_per_second, force):
+        """Delete S3 objects under restaurants/ that no restaurant references"""
+        try:
+            report = collect_garbage(
+                get_uploader(),
+                grace_period=timedelta(hours=grace_hours),
+                dry_run=dry_run,
+                batches_per_second=batches_per_second,
+                force=force
+            )
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Orphaned objects: {report['orphans']} ({report['bytes'] / 1024 / 1024:.1f} MB)")
+        for key in report['sample']:
+            click.echo(f"  {key}")
+        if dry_run:
+            click.echo("Dry run, nothing deleted. Re-run with --delete to remove them.")
+        else:
+            click.echo(f"Deleted: {report['deleted']}, errors: {report['errors']}")
+
+    @app.cli.command('reconcile-ratings')
+    def reconcile_ratings_command():
+        """Rebuild restaurant rating aggregates from the reviews collection"""
+        fixed = reconcile_ratings()
+        click.echo(f"Corrected rating aggregates of {fixed} restaurants")
+        if fixed and CATALOG_SNAPSHOTS:
+            # The debounced publish would die with this process
+            manifest = publish_catalog()
+            click.echo(f"Published catalog version {manifest['version']}")
+
+    @app.cli.command('rebuild-leaderboards')
+    def rebuild_leaderboards_command():
+        """Rebuild every per-hashtag leaderboard from the restaurants collection"""
+        count = rebuild_all_leaderboards()
+        click.echo(f"Rebuilt leaderboards for {count} hashtags")
+
+    @app.cli.command('publish-catalog')
+    @click.option('--prune-hours', default=24, show_default=True,
+                  help='Delete files the manifest dropped more than this many hours ago, -1 to keep them')
+    def publish_catalog_command(prune_hours):
+        """Publish precompressed catalog snapshots and the manifest to S3"""
+        try:
+            manifest = publish_catalog()
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Published catalog version {manifest['version']} ({len(manifest['files'])} files)")
+        if prune_hours >= 0:
+            deleted = prune_catalog(timedelta(hours=prune_hours))
+            click.echo(f"Pruned {deleted} superseded catalog files")
+
+    @app.cli.command('process-uploads')
+    def process_uploads_command():
+        """Process queued upload sessions, retry abandoned ones and expire unconfirmed ones"""
+        report = process_pending_uploads()
+        click.echo(f"Requeued {report['requeued']}, confirmed {report['confirmed']}, failed {report['failed']}, "
+                   f"expired {report['expired']}")
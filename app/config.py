@@ -14,6 +14,26 @@ CORS(app)
 # Set secret key for session management
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', '')
 
+# Response compression
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', '500'))
+app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', '6'))
+app.config['COMPRESS_CACHE_SIZE'] = int(os.getenv('COMPRESS_CACHE_SIZE', '128'))
+# Total bytes of cached bodies and their encoded variants
+app.config['COMPRESS_CACHE_MAX_BYTES'] = int(os.getenv('COMPRESS_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Admission control for upload-heavy routes (per process concurrency,
+# per client requests/second and burst)
+app.config['WRITE_MAX_CONCURRENT'] = int(os.getenv('WRITE_MAX_CONCURRENT', '2'))
+app.config['WRITE_RATE'] = float(os.getenv('WRITE_RATE', '0.5'))
+app.config['WRITE_BURST'] = int(os.getenv('WRITE_BURST', '5'))
+# Admission control for image renders (proxy cache misses), pages load many images at once
+app.config['IMAGE_MAX_CONCURRENT'] = int(os.getenv('IMAGE_MAX_CONCURRENT', '4'))
+app.config['IMAGE_RATE'] = float(os.getenv('IMAGE_RATE', '10'))
+app.config['IMAGE_BURST'] = int(os.getenv('IMAGE_BURST', '50'))
+# Reverse proxies in front of the app that append to X-Forwarded-For,
+# 0 rate limits by the peer address
+app.config['TRUSTED_PROXY_COUNT'] = int(os.getenv('TRUSTED_PROXY_COUNT', '0'))
+
 # Configure MongoDB
 app.config["MONGO_URI"] = f"{os.getenv('MONGO_URI')}/{os.getenv('DB_NAME')}"
 mongo = PyMongo(app)
@@ -0,0 +1,207 @@
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, current_app
+from pymongo import ReturnDocument
+from app.config import mongo
+
+# 'memory' keeps token buckets per process, 'mongo' shares them between workers
+ADMISSION_STORE = os.getenv('ADMISSION_STORE', 'memory')
+
+class MemoryTokenBuckets:
+    """Per-process token buckets"""
+
+    # Seconds between sweeps of buckets that have refilled
+    SWEEP_INTERVAL = 60
+
+    def __init__(self):
+        # key -> (tokens, updated_at, full_at)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def take(self, key, rate, burst):
+        """
+        Take one token from a bucket
+        :return: Tuple of (allowed, seconds until a token is available)
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept_at >= self.SWEEP_INTERVAL:
+                self._sweep(now)
+            tokens, updated_at, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def _sweep(self, now):
+        # A full bucket behaves like a missing one, so one-off clients don't
+        # keep an entry for the lifetime of the process
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        self._swept_at = now
+
+class MongoTokenBuckets:
+    """Token buckets shared by all workers, refilled and taken in one update"""
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        bucket = mongo.db.rate_limits.find_one_and_update(
+            {'_id': key},
+            [
+                {'$set': {
+                    'tokens': {'$min': [burst, {'$add': [
+                        {'$ifNull': ['$tokens', burst]},
+                        {'$multiply': [{'$max': [0, {'$subtract': [now, {'$ifNull': ['$ts', now]}]}]}, rate]}
+                    ]}]},
+                    'ts': now,
+                    # Idle buckets are full again by then, the TTL index drops them
+                    'expiresAt': datetime.utcnow() + timedelta(seconds=burst / rate + 60)
+                }},
+                {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+                {'$set': {'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        allowed = bucket['allowed']
+        return allowed, 0 if allowed else (1 - bucket['tokens']) / rate
+
+_buckets = MongoTokenBuckets() if ADMISSION_STORE == 'mongo' else MemoryTokenBuckets()
+_limiters = {}
+
+class RouteLimiter:
+    """Concurrency limit and counters of one route group in this process"""
+
+    def __init__(self, name, max_concurrent, rate, burst):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_concurrency = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot without waiting, False when the route is saturated"""
+        with self._lock:
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                self.rejected_concurrency += 1
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def reject_rate(self):
+        with self._lock:
+            self.rejected_rate += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'inFlight': self.in_flight,
+                'maxConcurrent': self.max_concurrent,
+                'admitted': self.admitted,
+                'rejectedRate': self.rejected_rate,
+                'rejectedConcurrency': self.rejected_concurrency
+            }
+
+def _client_id():
+    # Clients can put anything into X-Forwarded-For, only the addresses
+    # appended by our own proxies (the last TRUSTED_PROXY_COUNT) are reliable
+    trusted = current_app.config['TRUSTED_PROXY_COUNT']
+    forwarded = [addr.strip() for addr in request.headers.get('X-Forwarded-For', '').split(',') if addr.strip()]
+    if trusted and len(forwarded) >= trusted:
+        return forwarded[-trusted]
+    return request.remote_addr or 'unknown'
+
+class AdmissionRejected(Exception):
+    """Raised by admit() and check_rate(), carries the 429/503 response"""
+
+    def __init__(self, response):
+        super().__init__(response[1])
+        self.response = response
+
+def get_limiter(name, max_concurrent=0, rate=0, burst=1):
+    """
+    Limits and counters of a route group, created on first use
+    :param name: Route group, limits and counters are shared per name
+    :param max_concurrent: Requests processed at once per process, 0 for no limit
+    :param rate: Sustained requests per second per client, 0 for no limit
+    :param burst: Requests a client may make at once before being rate limited
+    """
+    return _limiters.setdefault(name, RouteLimiter(name, max_concurrent, rate, burst))
+
+def check_rate(limiter):
+    """
+    Take a token from the current client's bucket
+    :raises AdmissionRejected: With a 429 response if the client is over its rate
+    """
+    if not limiter.rate:
+        return
+    try:
+        allowed, retry_after = _buckets.take(f"{limiter.name}:{_client_id()}", limiter.rate, limiter.burst)
+    except Exception as e:
+        # Don't turn a rate limit store outage into an outage
+        print(f"Error in rate limiter: {str(e)}")
+        allowed, retry_after = True, 0
+    if not allowed:
+        limiter.reject_rate()
+        raise AdmissionRejected((jsonify({'error': 'Too many requests'}), 429,
+                                 {'Retry-After': str(max(1, math.ceil(retry_after)))}))
+
+@contextmanager
+def admit(limiter):
+    """
+    Hold one of the route group's concurrency slots
+    :raises AdmissionRejected: With a 503 response if the route is saturated
+    """
+    if not limiter.acquire():
+        raise AdmissionRejected((jsonify({'error': 'Server busy, try again shortly'}), 503,
+                                 {'Retry-After': '1'}))
+    try:
+        yield
+    finally:
+        limiter.release()
+
+def limit(name, max_concurrent=0, rate=0, burst=1):
+    """
+    Admission control for a route: reject instead of queueing when busy.
+    Routes where only part of the work is expensive use get_limiter,
+    check_rate and admit around that part instead.
+    :param name: Route group, limits and counters are shared per name
+    :param max_concurrent: Requests processed at once per process, 0 for no limit
+    :param rate: Sustained requests per second per client, 0 for no limit
+    :param burst: Requests a client may make at once before being rate limited
+    """
+    limiter = get_limiter(name, max_concurrent, rate, burst)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                check_rate(limiter)
+                with admit(limiter):
+                    return view(*args, **kwargs)
+            except AdmissionRejected as e:
+                return e.response
+
+        return wrapper
+
+    return decorator
+
+def admission_stats():
+    """Counters of every limited route group in this process"""
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
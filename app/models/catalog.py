@@ -0,0 +1,277 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+from pymongo import ReturnDocument
+from app.config import mongo
+from app.models.utils import parse_json
+from app.models.s3_utils import get_uploader
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are skipped without the package
+    brotli = None
+
+CATALOG_PREFIX = 'catalog/'
+MANIFEST_KEY = f'{CATALOG_PREFIX}manifest.json'
+# Publish automatically after writes
+CATALOG_SNAPSHOTS = os.getenv('CATALOG_SNAPSHOTS', 'True') == 'True'
+# Seconds without writes before a snapshot is published
+CATALOG_DEBOUNCE = float(os.getenv('CATALOG_DEBOUNCE', '10'))
+
+# Upper bound on the delay when writes keep arriving
+CATALOG_MAX_DELAY = CATALOG_DEBOUNCE * 6
+
+# Days files dropped from the manifest stay listed as retired
+CATALOG_RETIRED_DAYS = 7
+
+# Attempts at replacing the manifest when another publisher wrote it concurrently
+MANIFEST_WRITE_ATTEMPTS = 3
+
+# Seconds a process trusts its last read of the catalog version
+CATALOG_VERSION_TTL = float(os.getenv('CATALOG_VERSION_TTL', '1'))
+
+_timer = None
+_pending_since = None
+_version = None
+_version_read_at = 0
+_timer_lock = threading.Lock()
+_publish_lock = threading.Lock()
+
+def render_catalog():
+    """
+    Render the catalog files: all restaurants, all hashtags and one shard of
+    restaurants per hashtag
+    :return: Dict of file name -> JSON-serializable payload
+    """
+    hashtags = parse_json(list(mongo.db.hashtags.find()))
+    names = {hashtag['_id']: hashtag['name'] for hashtag in hashtags}
+
+    restaurants = parse_json(list(mongo.db.restaurants.find()))
+    shards = defaultdict(list)
+    for restaurant in restaurants:
+        restaurant['hashtagNames'] = [names.get(h_id) for h_id in restaurant.get('hashtags', [])]
+        for hashtag in set(restaurant.get('hashtags', [])):
+            shards[hashtag].append(restaurant)
+
+    files = {
+        'restaurants': {'restaurants': restaurants},
+        'hashtags': {'hashtags': hashtags},
+    }
+    for hashtag, shard in shards.items():
+        files[f'hashtags/{hashtag}'] = {'hashtag': hashtag, 'restaurants': shard}
+    return files
+
+def _encode(payload):
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str).encode()
+
+def _load_manifest(uploader):
+    """
+    Read the published manifest
+    :return: Tuple of (manifest, S3 ETag or None if there is none yet)
+    """
+    try:
+        obj = uploader.s3.get_object(Bucket=uploader.bucket, Key=MANIFEST_KEY)
+        return json.loads(obj['Body'].read()), obj['ETag']
+    except Exception:
+        return {'files': {}}, None
+
+def _write_manifest(uploader, manifest, etag):
+    """
+    Replace the manifest only if it is still the object read as etag
+    :return: False if another publisher wrote it in the meantime
+    """
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    try:
+        # The manifest is the only mutable object, keep its CDN lifetime short
+        _put(uploader, MANIFEST_KEY, _encode(manifest), cache_control='public, max-age=30', **condition)
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            return False
+        raise
+
+def _put(uploader, key, body, encoding=None, cache_control='public, max-age=31536000, immutable', **extra):
+    if encoding:
+        extra['ContentEncoding'] = encoding
+    uploader.s3.put_object(
+        Bucket=uploader.bucket,
+        Key=key,
+        Body=body,
+        ContentType='application/json',
+        CacheControl=cache_control,
+        **extra
+    )
+
+def _file_keys(uploader, files):
+    return {uploader.key_from_url(entry[encoding])
+            for entry in files.values() for encoding in ('gzip', 'br') if entry.get(encoding)}
+
+def _retired(uploader, current, files):
+    """
+    Files the new manifest drops, with the time they were dropped. Carried
+    in the manifest so pruning spares files clients may still be reading.
+    """
+    now = datetime.utcnow()
+    cutoff = (now - timedelta(days=CATALOG_RETIRED_DAYS)).isoformat() + 'Z'
+    keep = _file_keys(uploader, files)
+    retired = {key: at for key, at in current.get('retired', {}).items() if key not in keep and at >= cutoff}
+    for key in _file_keys(uploader, current.get('files', {})) - keep:
+        retired.setdefault(key, now.isoformat() + 'Z')
+    return retired
+
+def publish_catalog():
+    """
+    Publish precompressed catalog files and point the manifest at them.
+    Files are content-addressed, so unchanged shards are not uploaded again.
+    :return: The published manifest, which is a newer one from another
+        process if that rendered more recent data
+    """
+    with _publish_lock:
+        uploader = get_uploader()
+        # Read before rendering: the snapshot contains at least every write
+        # up to this version, which orders manifests across processes
+        doc = mongo.db.collection_versions.find_one({'_id': 'catalog'})
+        catalog_version = doc['version'] if doc else 0
+        previous = _load_manifest(uploader)[0].get('files', {})
+
+        files = {}
+        uploaded = 0
+        for name, payload in render_catalog().items():
+            body = _encode(payload)
+            digest = hashlib.sha256(body).hexdigest()[:16]
+            if previous.get(name, {}).get('digest') == digest:
+                files[name] = previous[name]
+                continue
+
+            base = f'{CATALOG_PREFIX}{name}/{digest}.json'
+            entry = {'digest': digest, 'size': len(body)}
+            _put(uploader, f'{base}.gz', gzip.compress(body, compresslevel=9), 'gzip')
+            entry['gzip'] = uploader.url_for_key(f'{base}.gz')
+            if brotli is not None:
+                _put(uploader, f'{base}.br', brotli.compress(body), 'br')
+                entry['br'] = uploader.url_for_key(f'{base}.br')
+            files[name] = entry
+            uploaded += 1
+
+        version = hashlib.sha256(
+            ''.join(f'{name}:{files[name]["digest"]}' for name in sorted(files)).encode()
+        ).hexdigest()[:16]
+        manifest = {
+            'version': version,
+            'catalogVersion': catalog_version,
+            'generatedAt': datetime.utcnow().isoformat() + 'Z',
+            'files': files
+        }
+        for _ in range(MANIFEST_WRITE_ATTEMPTS):
+            current, etag = _load_manifest(uploader)
+            if current.get('catalogVersion', -1) > catalog_version:
+                # A slower publisher must not roll the manifest back
+                print(f"Skipped catalog {version}: a newer manifest is published")
+                return current
+            manifest['retired'] = _retired(uploader, current, files)
+            if _write_manifest(uploader, manifest, etag):
+                print(f"Published catalog {version}: {uploaded} of {len(files)} files uploaded")
+                return manifest
+        raise RuntimeError("Catalog manifest kept changing during publish, giving up")
+
+def prune_catalog(grace_period=timedelta(hours=24)):
+    """
+    Delete catalog files the current manifest no longer points at
+    :param grace_period: timedelta, files uploaded or dropped from the
+        manifest more recently are kept for clients and CDN edges still
+        holding an older manifest
+    :return: Number of deleted objects
+    """
+    uploader = get_uploader()
+    manifest, etag = _load_manifest(uploader)
+    if etag is None:
+        return 0
+    referenced = _file_keys(uploader, manifest.get('files', {})) | {MANIFEST_KEY}
+    retired = manifest.get('retired', {})
+
+    now = datetime.now(timezone.utc)
+    retired_cutoff = (now - grace_period).replace(tzinfo=None).isoformat() + 'Z'
+    stale = []
+    paginator = uploader.s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=uploader.bucket, Prefix=CATALOG_PREFIX):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if key in referenced or obj['LastModified'] > now - grace_period:
+                continue  # Live, or uploaded by a publish that is still running
+            if retired.get(key, '') <= retired_cutoff:
+                stale.append(key)
+
+    deleted = 0
+    for start in range(0, len(stale), uploader.DELETE_BATCH_SIZE):
+        batch = stale[start:start + uploader.DELETE_BATCH_SIZE]
+        response = uploader.s3.delete_objects(
+            Bucket=uploader.bucket,
+            Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+        )
+        for error in response.get('Errors', []):
+            print(f"Error deleting {error.get('Key')} from S3: {error.get('Message')}")
+        deleted += len(batch) - len(response.get('Errors', []))
+    return deleted
+
+def _publish_in_background():
+    global _timer, _pending_since
+    with _timer_lock:
+        _timer = None
+        _pending_since = None
+    try:
+        publish_catalog()
+    except Exception as e:
+        print(f"Error publishing catalog: {str(e)}")
+
+def get_catalog_version():
+    """
+    Version of the restaurant/hashtag data, bumped by every catalog write.
+    Used to validate cached responses.
+    """
+    global _version, _version_read_at
+    if _version is None or time.monotonic() - _version_read_at >= CATALOG_VERSION_TTL:
+        doc = mongo.db.collection_versions.find_one({'_id': 'catalog'})
+        _version = doc['version'] if doc else 0
+        _version_read_at = time.monotonic()
+    return _version
+
+def _bump_catalog_version():
+    global _version, _version_read_at
+    doc = mongo.db.collection_versions.find_one_and_update(
+        {'_id': 'catalog'},
+        {'$inc': {'version': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    _version = doc['version']
+    _version_read_at = time.monotonic()
+
+def catalog_changed():
+    """
+    Record a catalog write: bump the catalog version and schedule a snapshot,
+    collapsing bursts of writes into one publish
+    """
+    global _timer, _pending_since
+    try:
+        _bump_catalog_version()
+    except Exception as e:
+        print(f"Error bumping catalog version: {str(e)}")
+    if not CATALOG_SNAPSHOTS:
+        return
+    with _timer_lock:
+        now = time.monotonic()
+        if _timer is not None:
+            if now - _pending_since >= CATALOG_MAX_DELAY:
+                return  # Let the pending publish run instead of postponing it
+            _timer.cancel()
+        else:
+            _pending_since = now
+        _timer = threading.Timer(CATALOG_DEBOUNCE, _publish_in_background)
+        _timer.daemon = True
+        _timer.start()
@@ -0,0 +1,194 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, make_response
+from app.models.catalog import get_catalog_version
+
+try:
+    import brotli
+except ImportError:  # Only gzip is offered without the package
+    brotli = None
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the response encoding from an Accept-Encoding header
+    :return: 'br', 'gzip' or None for identity
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        params = part.strip().split(';')
+        coding = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding] = quality
+
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+def compress_body(body, encoding, level):
+    """Compress a response body with the given encoding and 1-9 level"""
+    if encoding == 'br':
+        # Brotli quality runs 0-11, scale the shared level onto it
+        return brotli.compress(body, quality=min(11, round(level * 11 / 9)))
+    return gzip.compress(body, compresslevel=level)
+
+class EncodedBodyCache:
+    """
+    Thread-safe LRU of response bodies and their encoded variants, bounded
+    by entry count and by the total size of the bodies it holds
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Larger bodies are served but not kept, one list response must not
+        # be able to push out everything else
+        self.max_entry_bytes = max_bytes // 4
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        """Cache an entry holding at least 'body', bodies over max_entry_bytes are skipped"""
+        size = len(entry['body'])
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self.total_bytes += size
+            self._evict()
+
+    def add_variant(self, key, entry, encoding, data):
+        """Store an encoded variant in an entry and account for its size"""
+        with self._lock:
+            if encoding in entry:
+                return
+            entry[encoding] = data
+            # Entries evicted or too large to cache are not counted
+            if self._entries.get(key) is entry:
+                self._sizes[key] += len(data)
+                self.total_bytes += len(data)
+                self._evict()
+
+    def _discard(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            self.total_bytes -= self._sizes.pop(key)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self.total_bytes > self.max_bytes):
+            key, _ = self._entries.popitem(last=False)
+            self.total_bytes -= self._sizes.pop(key)
+
+_body_cache = None
+
+def _get_body_cache():
+    global _body_cache
+    if _body_cache is None:
+        _body_cache = EncodedBodyCache(current_app.config['COMPRESS_CACHE_SIZE'],
+                                       current_app.config['COMPRESS_CACHE_MAX_BYTES'])
+    return _body_cache
+
+def _encoded(cache, key, entry, encoding):
+    """Return the body for an encoding, compressing and remembering it once"""
+    config = current_app.config
+    body = entry['body']
+    if not encoding or len(body) < config['COMPRESS_MIN_SIZE']:
+        return body, None
+    if encoding not in entry:
+        cache.add_variant(key, entry, encoding, compress_body(body, encoding, config['COMPRESS_LEVEL']))
+    return entry[encoding], encoding
+
+def _representation_etag(etag, encoding):
+    """Strong ETag of one encoding of a body, br/gzip/identity bytes differ"""
+    return f"{etag}-{encoding or 'identity'}"
+
+def cached_catalog_response(view):
+    """
+    Serve a GET endpoint over catalog data from the encoded-body cache.
+    The validator is the catalog version plus the query, so an identical
+    repeated request skips the query, serialization and compression.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        query = '&'.join(sorted(f'{k}={v}' for k, v in request.args.items(multi=True)))
+        validator = f"{request.endpoint}|{sorted(kwargs.items())}|{query}|{get_catalog_version()}"
+        etag = hashlib.md5(validator.encode()).hexdigest()
+        accepted = negotiate_encoding(request.headers.get('Accept-Encoding'))
+
+        # Bodies under COMPRESS_MIN_SIZE are sent as identity even when the
+        # client accepts an encoding, so that copy is current as well
+        for encoding in dict.fromkeys((accepted, None)):
+            if _representation_etag(etag, encoding) in request.if_none_match:
+                response = make_response('', 304)
+                response.set_etag(_representation_etag(etag, encoding))
+                response.vary.add('Accept-Encoding')
+                return response
+
+        cache = _get_body_cache()
+        entry = cache.get(etag)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = {'body': response.get_data(), 'mimetype': response.mimetype}
+            cache.put(etag, entry)
+
+        body, encoding = _encoded(cache, etag, entry, accepted)
+        response = make_response(body, 200)
+        response.mimetype = entry['mimetype']
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(_representation_etag(etag, encoding))
+        return response
+
+    return wrapper
+
+def init_compression(app):
+    """Compress other JSON responses according to Accept-Encoding"""
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype != 'application/json'):
+            return response
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        body = response.get_data()
+        if not encoding or len(body) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.set_data(compress_body(body, encoding, app.config['COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # A strong ETag promises identical bytes, which no longer holds for
+        # the encoded body. Version ETags stay usable in If-Match as weak ones.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,27 @@
+import os
+import threading
+import time
+from app.config import mongo
+
+# Seconds before the cached hashtag map is reloaded from MongoDB
+HASHTAG_CACHE_TTL = int(os.getenv('HASHTAG_CACHE_TTL', '300'))
+
+_names = None
+_expires_at = 0
+_lock = threading.Lock()
+
+def get_hashtag_names():
+    """Return a cached {hashtag id: name} map of all hashtags"""
+    global _names, _expires_at
+    if _names is None or time.monotonic() >= _expires_at:
+        with _lock:
+            if _names is None or time.monotonic() >= _expires_at:
+                _names = {str(h['_id']): h['name'] for h in mongo.db.hashtags.find({}, {'name': 1})}
+                _expires_at = time.monotonic() + HASHTAG_CACHE_TTL
+    return _names
+
+def invalidate_hashtag_cache():
+    """Drop the cached map after hashtags were added, renamed or deleted"""
+    global _names
+    with _lock:
+        _names = None
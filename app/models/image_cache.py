@@ -0,0 +1,146 @@
+import os
+import fcntl
+import tempfile
+import time
+import threading
+from contextlib import contextmanager
+
+class DiskLRUCache:
+    """
+    Size-bounded cache of files in one directory, shared by all worker
+    processes. Recency is the files' mtime and the total size is a counter
+    file updated under a file lock, so N workers together stay within
+    max_bytes instead of each filling it up.
+    """
+
+    # Seconds between rescans that correct the counter (overwrites, files
+    # removed by hand)
+    SCAN_INTERVAL = 300
+    # Eviction frees space down to this fraction of max_bytes, so a full
+    # cache is not rescanned on every write
+    LOW_WATERMARK = 0.9
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._scanned_at = 0
+        self._lock = threading.Lock()
+        # Dot files are not cache entries
+        self._lock_path = os.path.join(directory, '.lock')
+        self._size_path = os.path.join(directory, '.size')
+
+        os.makedirs(directory, exist_ok=True)
+        with self._shared_lock():
+            self._write_total(self._trim())
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _shared_lock(self):
+        """Serialize size accounting with the other processes using the directory"""
+        with self._lock, open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_total(self):
+        try:
+            with open(self._size_path) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return self._trim()
+
+    def _write_total(self, total):
+        with open(self._size_path, 'w') as f:
+            f.write(str(total))
+
+    def _scan(self):
+        """Cached files as (mtime, name, size), least recently used first"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        return sorted(files)
+
+    def _trim(self):
+        """
+        Re-read the directory and remove the least recently used files over the limit
+        :return: Size of the remaining files
+        """
+        files = self._scan()
+        total = sum(size for _, _, size in files)
+        if total > self.max_bytes:
+            target = self.max_bytes * self.LOW_WATERMARK
+            # The newest file stays even if it alone is over the limit
+            for _, name, size in files[:-1]:
+                if total <= target:
+                    break
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+        self._scanned_at = time.monotonic()
+        return total
+
+    def get(self, name):
+        """Return the path of a cached file, or None"""
+        path = self._path(name)
+        try:
+            # Files written by other processes are hits too
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, name, data):
+        """Store a file, evicting the least recently used ones over the limit"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+
+        with self._shared_lock():
+            os.replace(tmp_path, self._path(name))
+            total = self._read_total() + len(data)
+            if total > self.max_bytes or time.monotonic() - self._scanned_at >= self.SCAN_INTERVAL:
+                total = self._trim()
+            self._write_total(total)
+        return self._path(name)
+
+class SingleFlight:
+    """Run a function once per key at a time, concurrent callers share the result"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': threading.Event()}
+
+        if not leader:
+            call['event'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
@@ -0,0 +1,42 @@
+import pymongo
+from app.config import mongo
+
+INDEXES = [
+    # "Top rated" sorting
+    ('restaurants', [('rating', pymongo.DESCENDING), ('reviewCount', pymongo.DESCENDING)], {}),
+    # Newest reviews of a restaurant
+    ('reviews', [('restaurantId', pymongo.ASCENDING), ('_id', pymongo.DESCENDING)], {}),
+    # Hashtag filters and leaderboard rebuilds
+    ('restaurants', [('hashtags', pymongo.ASCENDING)], {}),
+    # Duplicate hashtag names are rejected by the database, not by a pre-check
+    ('hashtags', [('name', pymongo.ASCENDING)], {'unique': True}),
+    # Expire idle shared rate limit buckets
+    ('rate_limits', [('expiresAt', pymongo.ASCENDING)], {'expireAfterSeconds': 0}),
+    # Drop finished upload sessions, unconfirmed ones are expired by
+    # process-uploads first so their raw objects are deleted too
+    ('upload_sessions', [('purgeAt', pymongo.ASCENDING)], {'expireAfterSeconds': 0}),
+]
+
+# Indexes the API is not correct without, (collection, index name)
+REQUIRED_INDEXES = {('hashtags', 'name_1')}
+
+class MissingIndexError(RuntimeError):
+    pass
+
+def ensure_indexes():
+    """
+    Create the indexes the API relies on, no-op when they already exist
+    :raises MissingIndexError: If a required index could not be created
+    """
+    missing = []
+    for collection, keys, options in INDEXES:
+        try:
+            mongo.db[collection].create_index(keys, **options)
+        except Exception as e:
+            # e.g. existing duplicates prevent a unique index, keep the others
+            print(f"Failed to create index {keys} on {collection}. Error: {str(e)}")
+            name = '_'.join(f'{field}_{direction}' for field, direction in keys)
+            if (collection, name) in REQUIRED_INDEXES:
+                missing.append(f'{collection}.{name}: {str(e)}')
+    if missing:
+        raise MissingIndexError(f"Required indexes are missing: {'; '.join(missing)}")
@@ -0,0 +1,155 @@
+import os
+import heapq
+from collections import defaultdict
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from bson import ObjectId
+from pymongo import ReturnDocument, ReplaceOne
+from app.config import mongo
+
+# Entries served per leaderboard
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '20'))
+# Extra entries stored beyond LEADERBOARD_SIZE so that a listed restaurant
+# losing score rarely forces a rebuild
+LEADERBOARD_BUFFER = int(os.getenv('LEADERBOARD_BUFFER', '10'))
+LEADERBOARD_CAPACITY = LEADERBOARD_SIZE + LEADERBOARD_BUFFER
+
+# Restaurant fields copied into leaderboard entries
+ENTRY_FIELDS = ('name', 'logo', 'shortLocation', 'rating', 'reviewCount')
+ENTRY_PROJECTION = {field: 1 for field in ENTRY_FIELDS + ('hashtags', 'createdAt')}
+
+def _created_timestamp(restaurant):
+    try:
+        return parsedate_to_datetime(restaurant['createdAt']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        if isinstance(restaurant.get('_id'), ObjectId):
+            return restaurant['_id'].generation_time.timestamp()
+        return 0
+
+METRICS = {
+    'rating': lambda r: r.get('rating') or 0,
+    'reviewCount': lambda r: r.get('reviewCount') or 0,
+    'recent': _created_timestamp,
+}
+
+def board_id(hashtag, metric):
+    return f"{hashtag}:{metric}"
+
+def _entry(restaurant, metric):
+    entry = {field: restaurant.get(field) for field in ENTRY_FIELDS}
+    entry['restaurantId'] = str(restaurant['_id'])
+    entry['score'] = METRICS[metric](restaurant)
+    return entry
+
+def _update_board(hashtag, metric, restaurant_id, entry):
+    """
+    Move one restaurant within a board, or remove it when entry is None
+    :return: False if the board has to be rebuilt to stay exact
+    """
+    boards = mongo.db.leaderboards
+    before = boards.find_one_and_update(
+        {'_id': board_id(hashtag, metric)},
+        {'$pull': {'entries': {'restaurantId': restaurant_id}}},
+        projection={'entries.restaurantId': 1, 'entries.score': 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return False
+
+    if entry is not None:
+        boards.update_one(
+            {'_id': board_id(hashtag, metric), 'entries.restaurantId': {'$ne': restaurant_id}},
+            {
+                '$push': {'entries': {
+                    '$each': [entry],
+                    '$sort': {'score': -1},
+                    '$slice': LEADERBOARD_CAPACITY
+                }},
+                '$set': {'updatedAt': datetime.utcnow()}
+            }
+        )
+
+    # A board that is not full lists every restaurant with the hashtag, so it
+    # stays exact. A full one only misses candidates when a listed restaurant
+    # left or fell to the bottom, where an unlisted one may now rank higher.
+    entries = before.get('entries', [])
+    if len(entries) < LEADERBOARD_CAPACITY:
+        return True
+    previous = next((e for e in entries if e['restaurantId'] == restaurant_id), None)
+    if previous is None:
+        return True
+    if entry is None:
+        return False
+    lowest_other = min((e['score'] for e in entries if e['restaurantId'] != restaurant_id), default=0)
+    return entry['score'] >= previous['score'] or entry['score'] >= lowest_other
+
+def update_leaderboards(restaurant, previous_hashtags=None):
+    """
+    Incrementally update the leaderboards a restaurant appears on
+    :param restaurant: Restaurant document with ENTRY_PROJECTION fields
+    :param previous_hashtags: Hashtags before the change, defaults to the
+        current ones
+    """
+    try:
+        restaurant_id = str(restaurant['_id'])
+        hashtags = set(restaurant.get('hashtags') or [])
+        if previous_hashtags is None:
+            previous_hashtags = hashtags
+        for hashtag in hashtags | set(previous_hashtags):
+            exact = True
+            for metric in METRICS:
+                entry = _entry(restaurant, metric) if hashtag in hashtags else None
+                exact = _update_board(hashtag, metric, restaurant_id, entry) and exact
+            if not exact:
+                rebuild_hashtag(hashtag)
+    except Exception as e:
+        print(f"Error updating leaderboards: {str(e)}")
+
+def remove_from_leaderboards(restaurant):
+    """Remove a deleted restaurant from its leaderboards"""
+    update_leaderboards({**restaurant, 'hashtags': []}, restaurant.get('hashtags') or [])
+
+def _write_boards(restaurants_by_hashtag):
+    operations = []
+    now = datetime.utcnow()
+    for hashtag, restaurants in restaurants_by_hashtag.items():
+        for metric, score in METRICS.items():
+            top = heapq.nlargest(LEADERBOARD_CAPACITY, restaurants, key=score)
+            operations.append(ReplaceOne(
+                {'_id': board_id(hashtag, metric)},
+                {
+                    'hashtag': hashtag,
+                    'metric': metric,
+                    'entries': [_entry(r, metric) for r in top],
+                    'updatedAt': now
+                },
+                upsert=True
+            ))
+    if operations:
+        mongo.db.leaderboards.bulk_write(operations, ordered=False)
+
+def rebuild_hashtag(hashtag):
+    """Rebuild all leaderboards of one hashtag from the restaurants collection"""
+    restaurants = list(mongo.db.restaurants.find({'hashtags': hashtag}, ENTRY_PROJECTION))
+    _write_boards({hashtag: restaurants})
+
+def rebuild_all_leaderboards():
+    """
+    Rebuild every leaderboard from a single scan of the restaurants
+    :return: Number of hashtags with a leaderboard
+    """
+    restaurants_by_hashtag = defaultdict(list)
+    for restaurant in mongo.db.restaurants.find({}, ENTRY_PROJECTION, batch_size=1000):
+        for hashtag in set(restaurant.get('hashtags') or []):
+            restaurants_by_hashtag[hashtag].append(restaurant)
+
+    _write_boards(restaurants_by_hashtag)
+    mongo.db.leaderboards.delete_many({'hashtag': {'$nin': list(restaurants_by_hashtag)}})
+    return len(restaurants_by_hashtag)
+
+def get_leaderboard(hashtag, metric, limit=LEADERBOARD_SIZE):
+    """Read the top entries of a leaderboard with a single _id lookup"""
+    return mongo.db.leaderboards.find_one(
+        {'_id': board_id(hashtag, metric)},
+        {'entries': {'$slice': min(limit, LEADERBOARD_SIZE)}, 'updatedAt': 1}
+    )
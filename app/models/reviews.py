@@ -0,0 +1,79 @@
+from pymongo import ReturnDocument, UpdateOne
+from app.config import mongo
+from app.models.leaderboards import ENTRY_PROJECTION, rebuild_hashtag
+from app.models.catalog import catalog_changed
+
+def _average(rating_sum, review_count):
+    return round(rating_sum / review_count, 2) if review_count > 0 else 0
+
+def apply_rating_change(restaurant_query, sum_delta, count_delta):
+    """
+    Update a restaurant's rating aggregate without re-reading its reviews
+    :param restaurant_query: Filter matching the restaurant
+    :param sum_delta: Change of the rating sum
+    :param count_delta: Change of the review count
+    :return: Updated restaurant with leaderboard fields, or None if not found
+    """
+    restaurant = mongo.db.restaurants.find_one_and_update(
+        restaurant_query,
+        {'$inc': {'ratingSum': sum_delta, 'reviewCount': count_delta}},
+        projection={**ENTRY_PROJECTION, 'ratingSum': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if restaurant is None:
+        return None
+
+    # Only applies if no other review write landed in between; that writer
+    # then sets the average for the newer sum and count instead
+    restaurant['rating'] = _average(restaurant['ratingSum'], restaurant['reviewCount'])
+    mongo.db.restaurants.update_one(
+        {
+            '_id': restaurant['_id'],
+            'ratingSum': restaurant['ratingSum'],
+            'reviewCount': restaurant['reviewCount']
+        },
+        {'$set': {'rating': restaurant['rating']}}
+    )
+    return restaurant
+
+def reconcile_ratings(batch_size=1000):
+    """
+    Rebuild every restaurant's rating aggregate from the reviews collection,
+    then the leaderboards and catalog version that depend on it
+    :param batch_size: Number of updates sent per bulk_write
+    :return: Number of restaurants whose aggregate was corrected
+    """
+    totals = {
+        total['_id']: total
+        for total in mongo.db.reviews.aggregate([
+            {'$group': {'_id': '$restaurantId', 'sum': {'$sum': '$rating'}, 'count': {'$sum': 1}}}
+        ])
+    }
+
+    fixed = 0
+    operations = []
+    hashtags = set()
+    projection = {'ratingSum': 1, 'reviewCount': 1, 'rating': 1, 'hashtags': 1}
+    for restaurant in mongo.db.restaurants.find({}, projection, batch_size=batch_size):
+        total = totals.get(str(restaurant['_id']), {'sum': 0, 'count': 0})
+        expected = {
+            'ratingSum': total['sum'],
+            'reviewCount': total['count'],
+            'rating': _average(total['sum'], total['count'])
+        }
+        if any(restaurant.get(field) != value for field, value in expected.items()):
+            operations.append(UpdateOne({'_id': restaurant['_id']}, {'$set': expected}))
+            hashtags.update(restaurant.get('hashtags') or [])
+        if len(operations) >= batch_size:
+            fixed += mongo.db.restaurants.bulk_write(operations, ordered=False).modified_count
+            operations = []
+
+    if operations:
+        fixed += mongo.db.restaurants.bulk_write(operations, ordered=False).modified_count
+
+    if fixed:
+        for hashtag in hashtags:
+            rebuild_hashtag(hashtag)
+        # Cached catalog responses are validated against this version
+        catalog_changed()
+    return fixed
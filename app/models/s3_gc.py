@@ -0,0 +1,103 @@
+import time
+from datetime import datetime, timedelta, timezone
+from app.config import mongo
+
+IMAGE_FIELDS = ('logo', 'images', 'menuImages')
+
+def referenced_keys(uploader):
+    """
+    Build the set of S3 keys referenced by any restaurant
+    :param uploader: S3Uploader used to map URLs to keys
+    :return: Set of keys
+    """
+    keys = set()
+    projection = {'_id': 0, **{field: 1 for field in IMAGE_FIELDS}}
+    for restaurant in mongo.db.restaurants.find({}, projection, batch_size=1000):
+        urls = [restaurant.get('logo')]
+        urls += restaurant.get('images') or []
+        urls += restaurant.get('menuImages') or []
+        for url in urls:
+            if isinstance(url, str) and url:
+                try:
+                    keys.add(uploader.key_from_url(url))
+                except IndexError:
+                    pass  # Not one of our bucket URLs
+    return keys
+
+def restaurants_with_images():
+    """Number of restaurants with a logo or at least one image or menu image"""
+    return mongo.db.restaurants.count_documents({'$or': [
+        {'logo': {'$nin': [None, '']}},
+        {'images.0': {'$exists': True}},
+        {'menuImages.0': {'$exists': True}},
+    ]})
+
+def find_orphans(uploader, grace_period, prefix='restaurants/', force=False):
+    """
+    Page through the bucket and yield objects no restaurant references
+    :param uploader: S3Uploader holding the client and bucket
+    :param grace_period: timedelta, younger objects are skipped because they
+        may belong to a request that is still in flight
+    :param prefix: Key prefix to scan
+    :param force: Skip the check that references were found at all
+    :return: Generator of (key, size, last_modified)
+    """
+    referenced = referenced_keys(uploader)
+    if not referenced and not force and restaurants_with_images():
+        # Every object would look orphaned although restaurants point at
+        # images, refuse rather than wipe the bucket
+        raise RuntimeError("No referenced images found although restaurants have images, aborting. "
+                           "Use --force if none of them are stored in this bucket")
+    cutoff = datetime.now(timezone.utc) - grace_period
+    paginator = uploader.s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=uploader.bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'] in referenced or obj['LastModified'] > cutoff:
+                continue
+            yield obj['Key'], obj['Size'], obj['LastModified']
+
+def collect_garbage(uploader, grace_period=timedelta(hours=24), dry_run=True,
+                    batches_per_second=1.0, prefix='restaurants/', force=False):
+    """
+    Delete orphaned objects in batches of up to 1000 keys
+    :param uploader: S3Uploader holding the client and bucket
+    :param grace_period: Minimum object age before it may be deleted
+    :param dry_run: Only report what would be deleted
+    :param batches_per_second: Rate limit for delete_objects requests
+    :param prefix: Key prefix to scan
+    :param force: Skip the check that references were found at all
+    :return: Report dict with counts, bytes and a sample of keys
+    """
+    started_at = datetime.utcnow()
+    report = {'orphans': 0, 'bytes': 0, 'deleted': 0, 'errors': 0, 'sample': []}
+    batch = []
+
+    def flush():
+        # Keys an upload referenced after the scan started are not claimed,
+        # uploads arriving during the delete wait for it and re-put the object
+        claimed = {}
+        for key in batch:
+            gen = uploader._claim_deletion(key, stale_before=started_at)
+            if gen is not None:
+                claimed[key] = gen
+        deleted, errors = uploader.delete_claimed(claimed)
+        report['deleted'] += len(deleted)
+        report['errors'] += errors
+        batch.clear()
+        if batches_per_second:
+            time.sleep(1.0 / batches_per_second)
+
+    for key, size, last_modified in find_orphans(uploader, grace_period, prefix, force):
+        report['orphans'] += 1
+        report['bytes'] += size
+        if len(report['sample']) < 20:
+            report['sample'].append(key)
+        if dry_run:
+            continue
+        batch.append(key)
+        if len(batch) >= uploader.DELETE_BATCH_SIZE:
+            flush()
+
+    if batch:
+        flush()
+    return report
@@ -1,19 +1,42 @@
 import boto3
 import os
 import mimetypes
+import hashlib
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from botocore.exceptions import ClientError
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from werkzeug.utils import secure_filename
-import uuid
 from PIL import Image
 from io import BytesIO
+from app.config import mongo
 
 class S3Uploader:
+    # Compression parameters applied to uploaded images. They are part of the
+    # content hash, so changing them produces new keys instead of stale hits.
+    IMAGE_MAX_SIZE = (400, 400)
+    IMAGE_QUALITY = 90
+    # delete_objects accepts at most 1000 keys per request
+    DELETE_BATCH_SIZE = 1000
+    # Seconds an upload waits for an in-flight delete of the same object
+    # before it assumes the deleting process died
+    DELETE_WAIT = 30
+
     def __init__(self):
         # Validate required environment variables
         self.bucket = os.getenv('AWS_STORAGE_BUCKET_NAME')
         self.region = os.getenv('AWS_S3_REGION_NAME')
         self.access_key = os.getenv('AWS_ACCESS_KEY_ID')
         self.secret_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+        # Optional S3-compatible endpoint (e.g. a local MinIO for development)
+        self.endpoint_url = os.getenv('AWS_S3_ENDPOINT_URL')
+        if self.endpoint_url:
+            self.base_url = f"{self.endpoint_url.rstrip('/')}/{self.bucket}"
+        else:
+            self.base_url = f"https://{self.bucket}.s3.{self.region}.amazonaws.com"
 
         # Print debug info (remove in production)
         print(f"Initializing S3 with bucket: {self.bucket}, region: {self.region}")
@@ -22,12 +45,19 @@ class S3Uploader:
         if not all([self.bucket, self.region, self.access_key, self.secret_key]):
             raise ValueError("Missing required AWS credentials in environment variables")
 
+        # Local content hash -> URL cache, saves a head_object per known upload
+        self._url_cache = {}
+        self._cache_lock = threading.Lock()
+        # Background deletes keep S3 round trips off the request path
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='s3-delete')
+
         try:
             self.s3 = boto3.client(
                 's3',
                 aws_access_key_id=self.access_key,
                 aws_secret_access_key=self.secret_key,
-                region_name=self.region
+                region_name=self.region,
+                endpoint_url=self.endpoint_url
             )
             # Test connection
             self.s3.list_buckets()
@@ -36,12 +66,77 @@ class S3Uploader:
             print(f"Failed to connect to AWS S3: {str(e)}")
             raise
 
-    def compress_image(self, image_data, max_size=(800, 800), quality=85):
+    @property
+    def refs(self):
+        """Reference counts of content-addressed objects, keyed by S3 key"""
+        return mongo.db.image_refs
+
+    def url_for_key(self, key):
+        """Build the public URL of an S3 key"""
+        return f"{self.base_url}/{key}"
+
+    def key_from_url(self, url):
+        """Extract the S3 key from a public URL"""
+        return url.split(f"{self.base_url}/")[1]
+
+    def content_digest(self, content, max_size=None, quality=None):
+        """
+        Hash the original bytes together with the compression parameters
+        :param content: Original (uncompressed) file bytes
+        :param max_size: Maximum dimensions used for compression
+        :param quality: JPEG quality used for compression
+        :return: Hex digest used as the object name
+        """
+        max_size = max_size or self.IMAGE_MAX_SIZE
+        quality = quality or self.IMAGE_QUALITY
+        digest = hashlib.sha256(content)
+        digest.update(f"|{max_size[0]}x{max_size[1]}|q{quality}".encode())
+        return digest.hexdigest()
+
+    def restaurant_prefix(self, restaurant_name, folder):
+        """Key prefix of a restaurant's folder, e.g. restaurants/<name>/images/"""
+        # Clean restaurant name (remove spaces and special characters)
+        clean_name = "".join(c for c in restaurant_name if c.isalnum()).lower()
+        return f"restaurants/{clean_name}/{folder}/"
+
+    def presigned_post(self, key, content_type, max_bytes, expires_in):
+        """
+        Let a client upload one object directly to S3
+        :param key: Exact key the client may write
+        :param content_type: Content-Type the client has to send
+        :param max_bytes: Largest accepted upload
+        :param expires_in: Seconds the form stays valid
+        :return: Dict with the form url and fields
+        """
+        return self.s3.generate_presigned_post(
+            Bucket=self.bucket,
+            Key=key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_bytes]
+            ],
+            ExpiresIn=expires_in
+        )
+
+    def object_exists(self, key):
+        """Check whether an object already exists in the bucket"""
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def compress_image(self, image_data, max_size=(800, 800), quality=85, image_format='JPEG', strict=False):
         """
         Compress image using PIL
         :param image_data: Binary image data
         :param max_size: Maximum dimensions (width, height)
-        :param quality: JPEG compression quality (1-100)
+        :param quality: JPEG/WEBP compression quality (1-100)
+        :param image_format: PIL output format (JPEG, WEBP, PNG)
+        :param strict: Raise on failure instead of returning the original
         :return: Compressed image data in bytes
         """
         try:
@@ -49,7 +144,7 @@ class S3Uploader:
             img = Image.open(BytesIO(image_data))
 
             # Convert to RGB if necessary (for PNG with transparency)
-            if img.mode in ('RGBA', 'P'):
+            if image_format == 'JPEG' and img.mode in ('RGBA', 'P'):
                 img = img.convert('RGB')
 
             # Resize if larger than max_size
@@ -58,86 +153,282 @@ class S3Uploader:
 
             # Save compressed image to bytes
             output = BytesIO()
-            img.save(output, format='JPEG', quality=quality, optimize=True)
+            img.save(output, format=image_format, quality=quality, optimize=True)
             return output.getvalue()
         except Exception as e:
             print(f"Error compressing image: {str(e)}")
+            if strict:
+                raise
             return image_data  # Return original if compression fails
 
     def upload_file(self, file_data, folder, restaurant_name=None):
         """
-        Upload a file to S3 with compression for images
+        Upload a file to S3 with compression for images.
+        Objects are content-addressed, so identical uploads share one key and
+        are only compressed and stored once. Every call adds one reference.
         :param file_data: File data to upload
         :param folder: Folder type (logos, images, menus)
-        :param restaurant_name: Name of the restaurant for folder organization
+        :param restaurant_name: Kept for compatibility; shared objects are not
+            stored under a single restaurant's folder
         """
+        if hasattr(file_data, 'filename'):
+            # FileStorage object
+            original_filename = secure_filename(file_data.filename)
+            return self.upload_content(
+                file_data.read(),
+                folder,
+                content_type=mimetypes.guess_type(original_filename)[0],
+                file_ext=os.path.splitext(original_filename)[1].lower()
+            )
+        return self.upload_content(file_data, folder, content_type='image/jpeg',
+                                   file_ext='.jpg', compress=False)
+
+    def upload_content(self, content, folder, content_type=None, file_ext='', compress=True):
+        """
+        Store bytes under their content-addressed key, compressing images
+        :param content: Original file bytes
+        :param folder: Folder type (logos, images, menus)
+        :param content_type: MIME type of the content
+        :param file_ext: Extension for non-image files
+        :param compress: Compress images to the stored JPEG size
+        :return: Public URL of the object
+        """
+        key = None
         try:
-            # Generate unique filename
-            unique_filename = f"{uuid.uuid4().hex}"
-            
-            if hasattr(file_data, 'filename'):
-                # FileStorage object
-                original_filename = secure_filename(file_data.filename)
-                content = file_data.read()
-                file_ext = os.path.splitext(original_filename)[1].lower()
-                content_type = mimetypes.guess_type(original_filename)[0]
+            is_image = bool(compress and content_type and content_type.startswith('image/'))
+            if is_image:
+                file_ext = '.jpg'
+
+            digest = self.content_digest(content)
+            key = f"restaurants/{folder}/{digest}{file_ext}"
+            url = self.url_for_key(key)
+
+            # Take the reference first so a concurrent delete keeps the object
+            ref = self.refs.find_one_and_update(
+                {'_id': key},
+                {
+                    '$inc': {'refs': 1},
+                    '$set': {'touchedAt': datetime.utcnow()},
+                    '$setOnInsert': {'createdAt': datetime.utcnow()}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+
+            if ref.get('deleting'):
+                # The last reference was just dropped and the object is being
+                # deleted, put it back once the delete went through
+                self._wait_for_deletion(key, ref['gen'])
+                self._forget(key)
+                exists = False
+            elif ref['refs'] > 1 and self._url_cache.get(digest) == url:
+                # Someone else already references it, and we have seen it before
+                return url
+            else:
+                exists = self.object_exists(key)
 
+            if not exists:
                 # Compress if it's an image
-                if content_type and content_type.startswith('image/'):
+                if is_image:
                     content = self.compress_image(
                         content,
-                        max_size=(400, 400),
-                        quality=90
+                        max_size=self.IMAGE_MAX_SIZE,
+                        quality=self.IMAGE_QUALITY
                     )
-                    file_ext = '.jpg'
                     content_type = 'image/jpeg'
-            else:
-                content = file_data
-                file_ext = '.jpg'
-                content_type = 'image/jpeg'
-
-            # Create final filename
-            final_filename = f"{unique_filename}{file_ext}"
-            
-            # Create S3 path based on restaurant name
-            if restaurant_name:
-                # Clean restaurant name (remove spaces and special characters)
-                clean_name = "".join(c for c in restaurant_name if c.isalnum()).lower()
-                s3_path = f"restaurants/{clean_name}/{folder}/{final_filename}"
-            else:
-                s3_path = f"restaurants/{folder}/{final_filename}"
-            
-            # Upload to S3
-            self.s3.put_object(
-                Bucket=self.bucket,
-                Key=s3_path,
-                Body=content,
-                ContentType=content_type or 'application/octet-stream'
-            )
-            
-            # Generate URL
-            url = f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{s3_path}"
+
+                # Upload to S3
+                self.s3.put_object(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=content,
+                    ContentType=content_type or 'application/octet-stream'
+                )
+
+            with self._cache_lock:
+                self._url_cache[digest] = url
             return url
-            
+
         except Exception as e:
             print(f"Error uploading to S3: {str(e)}")
+            if key:
+                try:
+                    self.delete_files([self.url_for_key(key)])
+                except Exception as release_error:
+                    print(f"Error releasing {key}: {str(release_error)}")
             raise
 
+    def _release(self, key):
+        """
+        Drop one reference to a key
+        :return: Deletion generation if the object is no longer referenced and
+            the caller has to delete it (see _claim_deletion), else None
+        """
+        ref = self.refs.find_one_and_update(
+            {'_id': key},
+            {'$inc': {'refs': -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if ref is not None and ref['refs'] > 0:
+            return None
+        # No counter: legacy uuid-named object, never shared
+        return self._claim_deletion(key)
+
+    def _claim_deletion(self, key, stale_before=None):
+        """
+        Mark an unreferenced object as being deleted. The counter stays until
+        the S3 delete is done, so an upload of the same content meanwhile
+        waits for it and puts the object back instead of trusting head_object.
+        :param stale_before: Also claim keys whose references were last
+            taken before this time (leaked references, used by the GC)
+        :return: Generation to pass to _finish_deletion, or None if the key
+            is referenced again or another caller is deleting it
+        """
+        unreferenced = {'refs': {'$lte': 0}}
+        if stale_before is not None:
+            unreferenced = {'$or': [unreferenced, {'touchedAt': {'$lt': stale_before}}]}
+        try:
+            ref = self.refs.find_one_and_update(
+                {'_id': key, 'deleting': {'$ne': True}, **unreferenced},
+                {
+                    '$set': {'deleting': True, 'deletingAt': datetime.utcnow()},
+                    '$inc': {'gen': 1},
+                    '$setOnInsert': {'refs': 0, 'createdAt': datetime.utcnow()}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The counter exists but is referenced or already being deleted
+            return None
+        return ref['gen']
+
+    def _finish_deletion(self, key, gen, deleted=True):
+        """
+        Drop the counter after the S3 delete. If an upload referenced the key
+        in between, only clear the mark, that upload puts the object back.
+        :param deleted: False if the S3 delete failed and the object is still there
+        """
+        if deleted:
+            self._forget(key)
+            if self.refs.delete_one({'_id': key, 'gen': gen, 'refs': {'$lte': 0}}).deleted_count:
+                return
+        self.refs.update_one({'_id': key, 'gen': gen}, {'$unset': {'deleting': '', 'deletingAt': ''}})
+
+    def _wait_for_deletion(self, key, gen):
+        """Wait until the delete marked with gen has finished"""
+        deadline = time.monotonic() + self.DELETE_WAIT
+        while time.monotonic() < deadline:
+            ref = self.refs.find_one({'_id': key}, {'deleting': 1, 'gen': 1})
+            if not ref or not ref.get('deleting') or ref.get('gen') != gen:
+                return
+            time.sleep(0.1)
+        # The deleter is gone. Bump the generation so it can no longer finish
+        # and remove the counter after our put.
+        self.refs.update_one(
+            {'_id': key, 'gen': gen},
+            {'$unset': {'deleting': '', 'deletingAt': ''}, '$inc': {'gen': 1}}
+        )
+
     def delete_file(self, url):
         """
-        Delete a file from S3
+        Delete a file from S3 once no restaurant references it any more
         :param url: Full URL of the file to delete
         """
         try:
             # Extract key from URL
-            key = url.split(f"{self.bucket}.s3.{self.region}.amazonaws.com/")[1]
-            
+            key = self.key_from_url(url)
+
+            gen = self._release(key)
+            if gen is None:
+                print(f"Keeping {key}, still referenced")
+                return
+
             # Delete from S3
-            self.s3.delete_object(
+            try:
+                self.s3.delete_object(
+                    Bucket=self.bucket,
+                    Key=key
+                )
+            except Exception:
+                self._finish_deletion(key, gen, deleted=False)
+                raise
+
+            self._finish_deletion(key, gen)
+
+        except Exception as e:
+            print(f"Error deleting from S3: {str(e)}")
+            raise
+
+    def _forget(self, key):
+        digest = os.path.splitext(os.path.basename(key))[0]
+        with self._cache_lock:
+            self._url_cache.pop(digest, None)
+
+    def delete_files(self, urls):
+        """
+        Release a list of files and delete the unreferenced ones in batches
+        :param urls: Full URLs of the files to delete
+        """
+        # Release one batch at a time, so uploads of a released object wait
+        # for one delete_objects call rather than for the whole list
+        for start in range(0, len(urls), self.DELETE_BATCH_SIZE):
+            claimed = {}
+            for url in urls[start:start + self.DELETE_BATCH_SIZE]:
+                try:
+                    key = self.key_from_url(url)
+                    gen = self._release(key)
+                    if gen is not None:
+                        claimed[key] = gen
+                except Exception as e:
+                    print(f"Error releasing {url}: {str(e)}")
+            self.delete_claimed(claimed)
+
+    def delete_claimed(self, claimed):
+        """
+        Delete objects claimed with _claim_deletion in one delete_objects call
+        :param claimed: Dict of key -> deletion generation, at most DELETE_BATCH_SIZE keys
+        :return: Tuple of (deleted keys, number of errors)
+        """
+        if not claimed:
+            return [], 0
+        failed = set(claimed)
+        errors = 1
+        try:
+            response = self.s3.delete_objects(
                 Bucket=self.bucket,
-                Key=key
+                Delete={'Objects': [{'Key': key} for key in claimed], 'Quiet': True}
             )
-            
+            for error in response.get('Errors', []):
+                print(f"Error deleting {error.get('Key')} from S3: {error.get('Message')}")
+            failed = {error.get('Key') for error in response.get('Errors', [])}
+            errors = len(failed)
         except Exception as e:
             print(f"Error deleting from S3: {str(e)}")
-            raise 
\ No newline at end of file
+        deleted = []
+        for key, gen in claimed.items():
+            self._finish_deletion(key, gen, deleted=key not in failed)
+            if key not in failed:
+                deleted.append(key)
+        return deleted, errors
+
+    def delete_files_async(self, urls):
+        """
+        Schedule delete_files on a background thread
+        :param urls: Full URLs of the files to delete
+        """
+        urls = [url for url in urls if url]
+        if urls:
+            self._executor.submit(self.delete_files, urls)
+
+_uploader = None
+_uploader_lock = threading.Lock()
+
+def get_uploader():
+    """Return the process-wide S3Uploader so its client and cache are shared"""
+    global _uploader
+    if _uploader is None:
+        with _uploader_lock:
+            if _uploader is None:
+                _uploader = S3Uploader()
+    return _uploader
@@ -0,0 +1,152 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from app.config import mongo
+from app.models.utils import get_current_time, id_query
+from app.models.s3_utils import get_uploader
+from app.models.leaderboards import update_leaderboards
+from app.models.catalog import catalog_changed
+
+# Restaurant field -> S3 folder of directly uploaded files
+UPLOAD_FIELDS = {'logo': 'logos', 'images': 'images', 'menuImages': 'menus'}
+# Sessions processing for longer than this are assumed to be abandoned
+UPLOAD_PROCESSING_TIMEOUT = int(os.getenv('UPLOAD_PROCESSING_TIMEOUT', '600'))
+# Seconds after its upload URLs expired that an unconfirmed session and its
+# raw uploads are kept, so a failed confirm can still be retried
+UPLOAD_SESSION_RETENTION = int(os.getenv('UPLOAD_SESSION_RETENTION', str(24 * 3600)))
+# Finished session documents are removed by a TTL index this long after
+UPLOAD_SESSION_HISTORY = timedelta(days=7)
+
+# Compression runs here instead of on the request worker that confirmed the upload
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-process')
+
+def enqueue_upload_session(session_id):
+    """Process a queued upload session on a background thread"""
+    _executor.submit(_process_in_background, session_id)
+
+def _process_in_background(session_id):
+    try:
+        process_upload_session(session_id)
+    except Exception as e:
+        print(f"Error processing upload session {session_id}: {str(e)}")
+
+def process_upload_session(session_id):
+    """
+    Compress the raw uploads of a queued session into the content-addressed
+    store and attach them to the restaurant
+    :param session_id: ObjectId of the upload session
+    :return: Final session status, or None if the session was not queued
+    """
+    session = mongo.db.upload_sessions.find_one_and_update(
+        {'_id': session_id, 'status': 'queued'},
+        {'$set': {'status': 'processing', 'processingAt': datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not session:
+        return None
+
+    s3_uploader = get_uploader()
+    urls = {field: [] for field in UPLOAD_FIELDS}
+    try:
+        for file in session['files']:
+            obj = s3_uploader.s3.get_object(Bucket=s3_uploader.bucket, Key=file['key'])
+            url = s3_uploader.upload_content(obj['Body'].read(), UPLOAD_FIELDS[file['field']],
+                                             content_type=file['contentType'])
+            urls[file['field']].append(url)
+
+        update = {
+            '$set': {'updatedAt': get_current_time()},
+            '$inc': {'__v': 1}
+        }
+        if urls['logo']:
+            update['$set']['logo'] = urls['logo'][0]
+        pushes = {field: {'$each': urls[field]} for field in ('images', 'menuImages') if urls[field]}
+        if pushes:
+            update['$push'] = pushes
+
+        previous = mongo.db.restaurants.find_one_and_update(
+            id_query(session['restaurantId']),
+            update,
+            return_document=ReturnDocument.BEFORE
+        )
+    except Exception as e:
+        # Give back the references taken so far, the raw uploads stay for a retry
+        s3_uploader.delete_files_async([url for field_urls in urls.values() for url in field_urls])
+        mongo.db.upload_sessions.update_one(
+            {'_id': session['_id']},
+            {'$set': {'status': 'failed', 'error': str(e)}}
+        )
+        raise
+
+    if previous is None:
+        s3_uploader.delete_files_async([url for field_urls in urls.values() for url in field_urls])
+        mongo.db.upload_sessions.update_one(
+            {'_id': session['_id']},
+            {'$set': {'status': 'failed', 'error': 'Restaurant not found'}}
+        )
+        return 'failed'
+
+    # The restaurant owns the compressed copies now, drop the raw uploads
+    s3_uploader.delete_files_async([s3_uploader.url_for_key(f['key']) for f in session['files']])
+    if urls['logo'] and previous.get('logo'):
+        s3_uploader.delete_files_async([previous['logo']])
+
+    mongo.db.upload_sessions.update_one(
+        {'_id': session['_id']},
+        {'$set': {'status': 'confirmed', 'urls': urls, 'purgeAt': datetime.utcnow() + UPLOAD_SESSION_HISTORY}}
+    )
+    try:
+        if urls['logo']:
+            # The previous state with this update applied, no read-back
+            update_leaderboards({**previous, **update['$set'], '__v': previous.get('__v', 0) + 1})
+        catalog_changed()
+    except Exception as e:
+        print(f"Error refreshing derived data after upload: {str(e)}")
+    return 'confirmed'
+
+def expire_upload_sessions(retention=UPLOAD_SESSION_RETENTION):
+    """
+    Expire sessions that were never confirmed and delete the raw objects
+    their presigned POSTs created
+    :param retention: Seconds after expiresAt before a session is expired
+    :return: Number of expired sessions
+    """
+    s3_uploader = get_uploader()
+    cutoff = datetime.utcnow() - timedelta(seconds=retention)
+    expired = 0
+    while True:
+        # Claimed one at a time, so a concurrent confirm cannot pick it up
+        session = mongo.db.upload_sessions.find_one_and_update(
+            {'status': {'$in': ['pending', 'failed', 'confirming']}, 'expiresAt': {'$lt': cutoff}},
+            {'$set': {'status': 'expired', 'purgeAt': datetime.utcnow() + UPLOAD_SESSION_HISTORY}},
+            projection={'files': 1}
+        )
+        if not session:
+            return expired
+        s3_uploader.delete_files([s3_uploader.url_for_key(f['key']) for f in session['files']])
+        expired += 1
+
+def process_pending_uploads(timeout=UPLOAD_PROCESSING_TIMEOUT):
+    """
+    Requeue sessions whose processing was abandoned, process every queued
+    session and expire the ones that were never confirmed
+    :param timeout: Seconds after which a processing session counts as abandoned
+    :return: Dict with the number of requeued, confirmed, failed and expired sessions
+    """
+    requeued = mongo.db.upload_sessions.update_many(
+        {'status': 'processing', 'processingAt': {'$lt': datetime.utcnow() - timedelta(seconds=timeout)}},
+        {'$set': {'status': 'queued'}}
+    ).modified_count
+
+    report = {'requeued': requeued, 'confirmed': 0, 'failed': 0}
+    for session in mongo.db.upload_sessions.find({'status': 'queued'}, {'_id': 1}):
+        try:
+            status = process_upload_session(session['_id'])
+        except Exception as e:
+            print(f"Error processing upload session {session['_id']}: {str(e)}")
+            status = 'failed'
+        if status in report:
+            report[status] += 1
+    report['expired'] = expire_upload_sessions()
+    return report
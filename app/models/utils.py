@@ -1,6 +1,9 @@
+import os
 import string
 import random
+from collections import Counter
 from datetime import datetime
+from bson import ObjectId
 
 def parse_json(data):
     """Helper function to convert ObjectId to string and format dates"""
@@ -8,6 +11,42 @@ def parse_json(data):
         return [{**item, '_id': str(item['_id'])} for item in data]
     return {**data, '_id': str(data['_id'])}
 
+def id_values(values):
+    """
+    Expand ids to every _id form they may be stored as, documents are
+    inserted with ObjectId or short string ids depending on the write path
+    """
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, str) and ObjectId.is_valid(value):
+            expanded.append(ObjectId(value))
+    return expanded
+
+def id_query(value):
+    """Build an _id filter that matches both ObjectId and short string ids"""
+    if ObjectId.is_valid(value):
+        return {'_id': {'$in': id_values([value])}}
+    return {'_id': value}
+
+def version_etag(version):
+    """ETag header value for a document __v"""
+    return f'"{version}"'
+
+def parse_version(if_match):
+    """
+    Read the expected __v from an If-Match header
+    :param if_match: Header value such as "3", W/"3" or 3
+    :return: int version, or None when the header is missing or *
+    :raises ValueError: If the value is not a version
+    """
+    if not if_match or if_match.strip() == '*':
+        return None
+    value = if_match.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    return int(value.strip('"'))
+
 def generate_short_id(length=9):
     """Generate a random string of letters and numbers"""
     characters = string.ascii_letters + string.digits
@@ -15,4 +54,47 @@ def generate_short_id(length=9):
 
 def get_current_time():
     """Get current time in the required format"""
-    return datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT") 
\ No newline at end of file
+    return datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT") 
+
+def parse_keep_list(form, field):
+    """
+    Read an ordered keep list from form data
+    :param form: Request form (MultiDict)
+    :param field: Field name, sent repeated or comma-separated
+    :return: List of URLs or ids, or None when the field was not sent
+    """
+    if field not in form:
+        return None
+    values = []
+    for value in form.getlist(field):
+        values.extend(item.strip() for item in value.split(',') if item.strip())
+    return values
+
+def merge_gallery(existing, keep, uploaded):
+    """
+    Work out an incremental gallery edit
+    :param existing: Current list of image URLs
+    :param keep: Ordered URLs or ids to keep, or None to keep nothing when
+        new files were uploaded and everything otherwise
+    :param uploaded: URLs of newly uploaded files, appended in order
+    :return: Tuple of (new URL list, URLs whose reference should be released)
+    """
+    existing = existing or []
+    if keep is None:
+        keep = [] if uploaded else existing
+
+    # Keep entries may be full URLs or object ids (file name without extension)
+    by_id = {os.path.splitext(url.rsplit('/', 1)[-1])[0]: url for url in existing}
+    gallery = []
+    for item in keep:
+        url = item if item in existing else by_id.get(item)
+        if url and url not in gallery:
+            gallery.append(url)
+    for url in uploaded:
+        if url not in gallery:
+            gallery.append(url)
+
+    # Every list entry holds one reference, release whatever is left over
+    released = Counter(existing) + Counter(uploaded)
+    released.subtract(Counter(gallery))
+    return gallery, list(released.elements())
@@ -1,6 +1,11 @@
 from flask import request, jsonify
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from app.config import mongo
 from app.models.utils import parse_json, generate_short_id
+from app.models.hashtag_cache import invalidate_hashtag_cache
+from app.models.catalog import catalog_changed
+from app.models.compression import cached_catalog_response
 
 def register_routes(app):
     @app.route('/api/hashtags', methods=['POST'])
@@ -11,25 +16,29 @@ def register_routes(app):
             if 'name' not in data:
                 return jsonify({'error': 'Name is required'}), 400
 
-            existing_hashtag = mongo.db.hashtags.find_one({'name': data['name']})
-            if existing_hashtag:
-                return jsonify({'error': 'Hashtag already exists'}), 409
-
             hashtag = {
                 '_id': data.get('_id', generate_short_id()),
                 'name': data['name']
             }
             
-            result = mongo.db.hashtags.insert_one(hashtag)
-            created_hashtag = mongo.db.hashtags.find_one({'_id': hashtag['_id']})
+            # The unique index on name rejects duplicates in the same round trip
+            try:
+                mongo.db.hashtags.insert_one(hashtag)
+            except DuplicateKeyError as e:
+                if 'name' in (e.details or {}).get('keyPattern', {}):
+                    return jsonify({'error': 'Hashtag already exists'}), 409
+                return jsonify({'error': 'Hashtag id already exists'}), 409
+            invalidate_hashtag_cache()
+            catalog_changed()
             return jsonify({'message': 'Hashtag added successfully', 
-                        'hashtag': parse_json(created_hashtag)}), 201
+                        'hashtag': parse_json(hashtag)}), 201
         
         except Exception as e:
             print(f"Error in add_hashtag: {str(e)}")
             return jsonify({'error': str(e)}), 500
 
     @app.route('/api/hashtags', methods=['GET'])
+    @cached_catalog_response
     def get_hashtags():
         try:
             search = request.args.get('search', '').lower()
@@ -51,18 +60,6 @@ def register_routes(app):
         try:
             data = request.get_json()
             
-            existing_hashtag = mongo.db.hashtags.find_one({'_id': hashtag_id})
-            if not existing_hashtag:
-                return jsonify({'error': 'Hashtag not found'}), 404
-
-            if 'name' in data:
-                name_exists = mongo.db.hashtags.find_one({
-                    '_id': {'$ne': hashtag_id},
-                    'name': data['name']
-                })
-                if name_exists:
-                    return jsonify({'error': 'Hashtag name already exists'}), 409
-
             update_data = {}
             if 'name' in data:
                 update_data['name'] = data['name']
@@ -70,12 +67,19 @@ def register_routes(app):
             if not update_data:
                 return jsonify({'error': 'No valid fields to update'}), 400
 
-            mongo.db.hashtags.update_one(
-                {'_id': hashtag_id},
-                {'$set': update_data}
-            )
+            try:
+                updated_hashtag = mongo.db.hashtags.find_one_and_update(
+                    {'_id': hashtag_id},
+                    {'$set': update_data},
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                return jsonify({'error': 'Hashtag name already exists'}), 409
+            if not updated_hashtag:
+                return jsonify({'error': 'Hashtag not found'}), 404
 
-            updated_hashtag = mongo.db.hashtags.find_one({'_id': hashtag_id})
+            invalidate_hashtag_cache()
+            catalog_changed()
             return jsonify({'message': 'Hashtag updated successfully',
                         'hashtag': parse_json(updated_hashtag)}), 200
         
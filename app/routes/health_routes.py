@@ -0,0 +1,10 @@
+import os
+from flask import jsonify
+from app.models.admission import admission_stats, ADMISSION_STORE
+
+def register_routes(app):
+    @app.route('/api/health/admission', methods=['GET'])
+    def get_admission_stats():
+        return jsonify({'pid': os.getpid(),
+                        'store': ADMISSION_STORE,
+                        'routes': admission_stats()}), 200
@@ -0,0 +1,113 @@
+import os
+import hashlib
+import tempfile
+from flask import request, jsonify, send_file
+from app.models.s3_utils import get_uploader
+from app.models.image_cache import DiskLRUCache, SingleFlight
+from app.models.admission import get_limiter, check_rate, admit, AdmissionRejected
+
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'findnbite-images'))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+# Rendered widths/heights. Requests are rounded up to the next one, so an
+# original has a bounded number of variants in the cache
+IMAGE_SIZES = (64, 128, 256, 400, 640, 800, 1080, 1600, 2000)
+IMAGE_MAX_DIMENSION = IMAGE_SIZES[-1]
+IMAGE_QUALITY = 85
+# Query fmt -> (PIL format, content type)
+IMAGE_FORMATS = {
+    'jpg': ('JPEG', 'image/jpeg'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+    'png': ('PNG', 'image/png'),
+}
+
+class ImageNotFound(Exception):
+    pass
+
+class ImageConversionError(Exception):
+    pass
+
+def snap_dimension(value):
+    """Round a requested dimension up to the next rendered size, 0 stays unconstrained"""
+    if not value:
+        return 0
+    return next(size for size in IMAGE_SIZES if size >= value)
+
+def register_routes(app):
+    s3_uploader = get_uploader()
+    cache = DiskLRUCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+    renders = SingleFlight()
+    # Only renders are limited, cache hits are served regardless
+    render_limiter = get_limiter('image-render',
+                                 max_concurrent=app.config['IMAGE_MAX_CONCURRENT'],
+                                 rate=app.config['IMAGE_RATE'],
+                                 burst=app.config['IMAGE_BURST'])
+
+    def render(key, size, image_format, name):
+        """Fetch the original from S3, resize it and store it in the disk cache"""
+        with admit(render_limiter):
+            return _render(key, size, image_format, name)
+
+    def _render(key, size, image_format, name):
+        try:
+            obj = s3_uploader.s3.get_object(Bucket=s3_uploader.bucket, Key=key)
+        except s3_uploader.s3.exceptions.NoSuchKey:
+            raise ImageNotFound(key)
+        try:
+            # Never cache the original under a variant's name
+            data = s3_uploader.compress_image(obj['Body'].read(), max_size=size, quality=IMAGE_QUALITY,
+                                              image_format=image_format, strict=True)
+        except Exception as e:
+            raise ImageConversionError(str(e))
+        return cache.put(name, data)
+
+    def render_once(key, size, image_format, name):
+        """Render a missing variant, charged to the client's rate, concurrent misses share one render"""
+        check_rate(render_limiter)
+        return renders.do(name, lambda: render(key, size, image_format, name))
+
+    @app.route('/img/<path:key>', methods=['GET'])
+    def get_image(key):
+        try:
+            if not key.startswith('restaurants/') or '..' in key.split('/'):
+                return jsonify({'error': 'Image not found'}), 404
+
+            width = request.args.get('w', 0, type=int)
+            height = request.args.get('h', 0, type=int)
+            if not (0 <= width <= IMAGE_MAX_DIMENSION and 0 <= height <= IMAGE_MAX_DIMENSION):
+                return jsonify({'error': f'w and h must be between 0 and {IMAGE_MAX_DIMENSION}'}), 400
+            fmt = request.args.get('fmt', 'jpeg').lower()
+            if fmt not in IMAGE_FORMATS:
+                return jsonify({'error': f"fmt must be one of: {', '.join(IMAGE_FORMATS)}"}), 400
+            image_format, content_type = IMAGE_FORMATS[fmt]
+
+            # A missing dimension is unconstrained, the aspect ratio is kept.
+            # Images are never upscaled, so sizes past the original's are the original's
+            size = (snap_dimension(width) or IMAGE_MAX_DIMENSION, snap_dimension(height) or IMAGE_MAX_DIMENSION)
+            name = hashlib.sha256(f"{key}|{size[0]}x{size[1]}|{image_format}|q{IMAGE_QUALITY}".encode()).hexdigest()
+
+            path = cache.get(name)
+            if path is None:
+                # Concurrent misses for the same variant wait for one render
+                path = render_once(key, size, image_format, name)
+
+            try:
+                response = send_file(path, mimetype=content_type, conditional=True, etag=name)
+            except FileNotFoundError:
+                # Evicted between lookup and send
+                path = render_once(key, size, image_format, name)
+                response = send_file(path, mimetype=content_type, conditional=True, etag=name)
+            # Originals are content-addressed, so a variant never changes
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+            return response
+
+        except AdmissionRejected as e:
+            return e.response
+        except ImageNotFound:
+            return jsonify({'error': 'Image not found'}), 404
+        except ImageConversionError as e:
+            print(f"Error converting image {key}: {str(e)}")
+            return jsonify({'error': 'Image could not be converted'}), 422
+        except Exception as e:
+            print(f"Error in get_image: {str(e)}")
+            return jsonify({'error': str(e)}), 500
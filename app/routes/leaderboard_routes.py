@@ -0,0 +1,21 @@
+from flask import request, jsonify
+from app.models.leaderboards import get_leaderboard, METRICS, LEADERBOARD_SIZE
+
+def register_routes(app):
+    @app.route('/api/hashtags/<hashtag_id>/top', methods=['GET'])
+    def get_top_restaurants(hashtag_id):
+        try:
+            metric = request.args.get('by', 'rating')
+            if metric not in METRICS:
+                return jsonify({'error': f"by must be one of: {', '.join(METRICS)}"}), 400
+            limit = min(max(request.args.get('limit', LEADERBOARD_SIZE, type=int), 1), LEADERBOARD_SIZE)
+
+            board = get_leaderboard(hashtag_id, metric, limit)
+            entries = board['entries'] if board else []
+            for entry in entries:
+                entry.pop('score', None)
+            return jsonify({'hashtag': hashtag_id, 'by': metric, 'restaurants': entries}), 200
+
+        except Exception as e:
+            print(f"Error in get_top_restaurants: {str(e)}")
+            return jsonify({'error': str(e)}), 500
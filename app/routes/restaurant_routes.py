@@ -1,13 +1,75 @@
 from flask import request, jsonify
+from pymongo import ReturnDocument
 from app.config import mongo
-from app.models.utils import parse_json, get_current_time
-from app.models.s3_utils import S3Uploader
-from werkzeug.utils import secure_filename
+from app.models.utils import (parse_json, get_current_time, parse_keep_list, merge_gallery,
+                              id_query, id_values, parse_version, version_etag)
+from app.models.s3_utils import get_uploader
+from app.models.leaderboards import update_leaderboards, ENTRY_FIELDS
+from app.models.catalog import catalog_changed
+from app.models.compression import cached_catalog_response
+from app.models.admission import limit
+
+# Most restaurants a single batch request may ask for
+BATCH_LIMIT = 100
+
+def attach_hashtag_names(restaurants, projection=None):
+    """
+    Add hashtagNames to restaurants with one hashtag lookup for all of them
+    :param projection: Projection from parse_projection, names are only
+        added when it is None or asks for hashtagNames
+    """
+    if projection is not None and 'hashtagNames' not in projection:
+        return
+
+    hashtag_ids = set()
+    for restaurant in restaurants:
+        hashtag_ids.update(restaurant.get('hashtags') or [])
+
+    hashtags = {}
+    if hashtag_ids:
+        hashtags = {str(h['_id']): h['name']
+                for h in mongo.db.hashtags.find({'_id': {'$in': id_values(hashtag_ids)}}, {'name': 1})}
+
+    for restaurant in restaurants:
+        restaurant['hashtagNames'] = [hashtags.get(h_id) for h_id in restaurant.get('hashtags') or []]
+
+def parse_projection(fields):
+    """
+    Build a MongoDB projection from requested fields
+    :param fields: List or comma-separated string of field names, or None
+    :return: Projection dict, or None for whole documents
+    :raises ValueError: If fields is neither a string nor a list of strings
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        raise ValueError('fields must be a string or a list of strings')
+    fields = [field.strip() for field in fields if field.strip()]
+    if not fields:
+        return None
+    # hashtagNames is derived from hashtags, projecting the missing field itself is harmless
+    projection = {field: 1 for field in fields}
+    if 'hashtagNames' in fields:
+        projection['hashtags'] = 1
+    return projection
+
+def _version_conflict(current):
+    return jsonify({'error': 'Restaurant was modified by someone else',
+                    'version': current.get('__v', 0)}), 409, {'ETag': version_etag(current.get('__v', 0))}
 
 def register_routes(app):
-    s3_uploader = S3Uploader()
+    s3_uploader = get_uploader()
+    # Creates and updates compress and upload images, keep them from
+    # occupying every worker
+    write_limit = limit('restaurant-writes',
+                        max_concurrent=app.config['WRITE_MAX_CONCURRENT'],
+                        rate=app.config['WRITE_RATE'],
+                        burst=app.config['WRITE_BURST'])
 
     @app.route('/api/restaurants', methods=['POST'])
+    @write_limit
     def add_restaurant():
         try:
             # Handle form data
@@ -61,43 +123,46 @@ def register_routes(app):
                 'menuImages': uploaded_files['menuImages'],
                 'logo': uploaded_files['logo'],
                 'rating': 0,
+                'ratingSum': 0,
                 'reviewCount': 0,
                 '__v': 0,
                 'createdAt': current_time,
                 'updatedAt': current_time
             }
             
-            result = mongo.db.restaurants.insert_one(restaurant)
-            created_restaurant = mongo.db.restaurants.find_one({'_id': result.inserted_id})
+            # insert_one sets the generated _id on the document itself
+            mongo.db.restaurants.insert_one(restaurant)
+            update_leaderboards(restaurant)
+            catalog_changed()
             return jsonify({'message': 'Restaurant added successfully', 
-                        'restaurant': parse_json(created_restaurant)}), 201
+                        'restaurant': parse_json(restaurant)}), 201, {'ETag': version_etag(0)}
         
         except Exception as e:
             print(f"Error in add_restaurant: {str(e)}")
             return jsonify({'error': str(e)}), 500
 
     @app.route('/api/restaurants', methods=['GET'])
+    @cached_catalog_response
     def get_restaurants():
         print("GET /restaurants endpoint hit")
         try:
             hashtag = request.args.get('hashtag')
+            sort = request.args.get('sort')
+            limit = request.args.get('limit', 0, type=int)
             
             query = {}
             if hashtag:
                 query['hashtags'] = hashtag
 
-            restaurants = list(mongo.db.restaurants.find(query))
+            cursor = mongo.db.restaurants.find(query)
+            if sort == 'rating':
+                # Top rated first, served by the rating index
+                cursor = cursor.sort([('rating', -1), ('reviewCount', -1)])
+            if limit > 0:
+                cursor = cursor.limit(limit)
+            restaurants = list(cursor)
             
-            if restaurants:
-                hashtag_ids = set()
-                for restaurant in restaurants:
-                    hashtag_ids.update(restaurant.get('hashtags', []))
-                
-                hashtags = {h['_id']: h['name'] 
-                        for h in mongo.db.hashtags.find({'_id': {'$in': list(hashtag_ids)}})}
-                
-                for restaurant in restaurants:
-                    restaurant['hashtagNames'] = [hashtags.get(h_id) for h_id in restaurant.get('hashtags', [])]
+            attach_hashtag_names(restaurants)
 
             print(f"Found {len(restaurants)} restaurants")
             return jsonify({'restaurants': parse_json(restaurants)}), 200
@@ -106,14 +171,63 @@ def register_routes(app):
             print(f"Error in get_restaurants: {str(e)}")
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/restaurants/<restaurant_id>', methods=['GET'])
+    def get_restaurant(restaurant_id):
+        try:
+            projection = parse_projection(request.args.get('fields'))
+            restaurant = mongo.db.restaurants.find_one(id_query(restaurant_id), projection)
+            if not restaurant:
+                return jsonify({'error': 'Restaurant not found'}), 404
+
+            attach_hashtag_names([restaurant], projection)
+            headers = {'ETag': version_etag(restaurant['__v'])} if '__v' in restaurant else {}
+            return jsonify({'restaurant': parse_json(restaurant)}), 200, headers
+
+        except Exception as e:
+            print(f"Error in get_restaurant: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/restaurants/batch', methods=['POST'])
+    def get_restaurants_batch():
+        try:
+            data = request.get_json() or {}
+            ids = data.get('ids')
+
+            if not isinstance(ids, list) or not ids:
+                return jsonify({'error': 'ids must be a non-empty list'}), 400
+            # Keep the first occurrence of each id, in request order
+            ids = list(dict.fromkeys(str(restaurant_id) for restaurant_id in ids))
+            if len(ids) > BATCH_LIMIT:
+                return jsonify({'error': f'At most {BATCH_LIMIT} ids per request'}), 400
+
+            try:
+                projection = parse_projection(data.get('fields'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            found = {str(r['_id']): r
+                     for r in mongo.db.restaurants.find({'_id': {'$in': id_values(ids)}}, projection)}
+
+            restaurants = [found[restaurant_id] for restaurant_id in ids if restaurant_id in found]
+            attach_hashtag_names(restaurants, projection)
+            return jsonify({
+                'restaurants': parse_json(restaurants),
+                'missing': [restaurant_id for restaurant_id in ids if restaurant_id not in found]
+            }), 200
+
+        except Exception as e:
+            print(f"Error in get_restaurants_batch: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
     @app.route('/api/restaurants/<restaurant_id>', methods=['PUT'])
+    @write_limit
     def update_restaurant(restaurant_id):
         try:
             data = request.form.to_dict()
-            
-            existing_restaurant = mongo.db.restaurants.find_one({'_id': restaurant_id})
-            if not existing_restaurant:
-                return jsonify({'error': 'Restaurant not found'}), 404
+
+            try:
+                expected_version = parse_version(request.headers.get('If-Match'))
+            except ValueError:
+                return jsonify({'error': 'If-Match must be a restaurant version'}), 400
 
             update_data = {}
             
@@ -132,54 +246,91 @@ def register_routes(app):
                     else:
                         update_data[field] = data[field]
 
+            # Image changes are diffed against the stored URLs, only then the
+            # current document has to be read before writing
+            # getlist, values() would only look at the first part per field
+            has_files = any(f.filename for key in request.files for f in request.files.getlist(key)) or \
+                'keepImages' in request.form or 'keepMenuImages' in request.form
+            existing_restaurant = None
+            if has_files:
+                existing_restaurant = mongo.db.restaurants.find_one(
+                    id_query(restaurant_id),
+                    {'logo': 1, 'images': 1, 'menuImages': 1, '__v': 1}
+                )
+                if not existing_restaurant:
+                    return jsonify({'error': 'Restaurant not found'}), 404
+                if expected_version is not None and existing_restaurant.get('__v', 0) != expected_version:
+                    return _version_conflict(existing_restaurant)
+
             # Handle file updates
+            released_urls = []
+            uploaded_urls = []
             if 'logo' in request.files:
                 logo_file = request.files['logo']
                 if logo_file.filename:
-                    # Delete old logo if exists
-                    if existing_restaurant.get('logo'):
-                        s3_uploader.delete_file(existing_restaurant['logo'])
                     update_data['logo'] = s3_uploader.upload_file(logo_file, 'logos')
+                    uploaded_urls.append(update_data['logo'])
+                    # Release old logo if it was replaced
+                    if existing_restaurant.get('logo'):
+                        released_urls.append(existing_restaurant['logo'])
 
-            # Handle images
-            if 'images' in request.files:
-                images = request.files.getlist('images')
-                if images and images[0].filename:
-                    # Delete old images
-                    for old_image in existing_restaurant.get('images', []):
-                        s3_uploader.delete_file(old_image)
-                    # Upload new images
-                    update_data['images'] = [
-                        s3_uploader.upload_file(image, 'images')
-                        for image in images if image.filename
-                    ]
+            # Handle images and menu images: keep lists select, remove and
+            # reorder existing URLs, new files are appended
+            for field, keep_field, folder in (('images', 'keepImages', 'images'),
+                                              ('menuImages', 'keepMenuImages', 'menus')):
+                keep = parse_keep_list(request.form, keep_field)
+                new_files = [f for f in request.files.getlist(field) if f.filename]
+                if keep is None and not new_files:
+                    continue
 
-            # Handle menu images
-            if 'menuImages' in request.files:
-                menu_images = request.files.getlist('menuImages')
-                if menu_images and menu_images[0].filename:
-                    # Delete old menu images
-                    for old_menu in existing_restaurant.get('menuImages', []):
-                        s3_uploader.delete_file(old_menu)
-                    # Upload new menu images
-                    update_data['menuImages'] = [
-                        s3_uploader.upload_file(menu_image, 'menus')
-                        for menu_image in menu_images if menu_image.filename
-                    ]
+                uploaded = [s3_uploader.upload_file(f, folder) for f in new_files]
+                uploaded_urls.extend(uploaded)
+                existing = existing_restaurant.get(field, [])
+                gallery, released = merge_gallery(existing, keep, uploaded)
+                if gallery != existing:
+                    update_data[field] = gallery
+                released_urls.extend(released)
 
             if not update_data:
+                # Re-sent identical files still took a reference each
+                s3_uploader.delete_files_async(released_urls)
                 return jsonify({'error': 'No valid fields to update'}), 400
 
             update_data['updatedAt'] = get_current_time()
 
-            mongo.db.restaurants.update_one(
-                {'_id': restaurant_id},
-                {'$set': update_data}
+            # Single round trip: version check, write and the previous state
+            # (for leaderboards) at once; the result is update_data applied to it
+            query = id_query(restaurant_id)
+            if expected_version is None and existing_restaurant is not None:
+                # Images were diffed against this version, don't overwrite a newer one
+                expected_version = existing_restaurant.get('__v', 0)
+            if expected_version is not None:
+                # Documents written before __v existed count as version 0
+                query['__v'] = expected_version if expected_version else {'$in': [0, None]}
+            previous = mongo.db.restaurants.find_one_and_update(
+                query,
+                {'$set': update_data, '$inc': {'__v': 1}},
+                return_document=ReturnDocument.BEFORE
             )
 
-            updated_restaurant = mongo.db.restaurants.find_one({'_id': restaurant_id})
+            if previous is None:
+                # Nothing written, give the new uploads back
+                s3_uploader.delete_files_async(uploaded_urls)
+                current = mongo.db.restaurants.find_one(id_query(restaurant_id), {'__v': 1})
+                if not current:
+                    return jsonify({'error': 'Restaurant not found'}), 404
+                return _version_conflict(current)
+
+            # Only objects that are no longer used, deleted off the request path
+            s3_uploader.delete_files_async(released_urls)
+
+            updated_restaurant = {**previous, **update_data, '__v': previous.get('__v', 0) + 1}
+            if set(update_data) & (set(ENTRY_FIELDS) | {'hashtags'}):
+                update_leaderboards(updated_restaurant, previous.get('hashtags'))
+            catalog_changed()
             return jsonify({'message': 'Restaurant updated successfully',
-                        'restaurant': parse_json(updated_restaurant)}), 200
+                        'restaurant': parse_json(updated_restaurant)}), 200, \
+                {'ETag': version_etag(updated_restaurant['__v'])}
         
         except Exception as e:
             print(f"Error in update_restaurant: {str(e)}")
@@ -0,0 +1,128 @@
+from flask import request, jsonify
+from pymongo import ReturnDocument
+from app.config import mongo
+from app.models.utils import parse_json, get_current_time, id_query
+from app.models.reviews import apply_rating_change
+from app.models.leaderboards import update_leaderboards
+from app.models.catalog import catalog_changed
+
+def _parse_rating(value):
+    """Return the rating as an int between 1 and 5, or None if invalid"""
+    try:
+        rating = int(value)
+    except (TypeError, ValueError):
+        return None
+    return rating if 1 <= rating <= 5 else None
+
+def _rating_changed(restaurant):
+    """Propagate a new rating aggregate to the leaderboards and catalog"""
+    if restaurant:
+        update_leaderboards(restaurant)
+        catalog_changed()
+
+def register_routes(app):
+    @app.route('/api/restaurants/<restaurant_id>/reviews', methods=['POST'])
+    def add_review(restaurant_id):
+        try:
+            data = request.get_json() or {}
+
+            rating = _parse_rating(data.get('rating'))
+            if rating is None:
+                return jsonify({'error': 'Rating must be an integer between 1 and 5'}), 400
+
+            restaurant = mongo.db.restaurants.find_one(id_query(restaurant_id), {'_id': 1})
+            if not restaurant:
+                return jsonify({'error': 'Restaurant not found'}), 404
+
+            current_time = get_current_time()
+            review = {
+                'restaurantId': str(restaurant['_id']),
+                'rating': rating,
+                'comment': data.get('comment', ''),
+                'author': data.get('author', ''),
+                'createdAt': current_time,
+                'updatedAt': current_time
+            }
+            mongo.db.reviews.insert_one(review)
+            _rating_changed(apply_rating_change({'_id': restaurant['_id']}, rating, 1))
+
+            return jsonify({'message': 'Review added successfully',
+                        'review': parse_json(review)}), 201
+
+        except Exception as e:
+            print(f"Error in add_review: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/restaurants/<restaurant_id>/reviews', methods=['GET'])
+    def get_reviews(restaurant_id):
+        try:
+            page = max(request.args.get('page', 0, type=int), 0)
+            limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+
+            restaurant = mongo.db.restaurants.find_one(id_query(restaurant_id), {'_id': 1})
+            if not restaurant:
+                return jsonify({'error': 'Restaurant not found'}), 404
+
+            reviews = list(mongo.db.reviews.find({'restaurantId': str(restaurant['_id'])})
+                           .sort('_id', -1)
+                           .skip(page * limit)
+                           .limit(limit))
+            return jsonify({'reviews': parse_json(reviews)}), 200
+
+        except Exception as e:
+            print(f"Error in get_reviews: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/reviews/<review_id>', methods=['PUT'])
+    def update_review(review_id):
+        try:
+            data = request.get_json() or {}
+
+            update_data = {}
+            if 'rating' in data:
+                rating = _parse_rating(data['rating'])
+                if rating is None:
+                    return jsonify({'error': 'Rating must be an integer between 1 and 5'}), 400
+                update_data['rating'] = rating
+            for field in ('comment', 'author'):
+                if field in data:
+                    update_data[field] = data[field]
+
+            if not update_data:
+                return jsonify({'error': 'No valid fields to update'}), 400
+
+            update_data['updatedAt'] = get_current_time()
+
+            previous = mongo.db.reviews.find_one_and_update(
+                id_query(review_id),
+                {'$set': update_data},
+                return_document=ReturnDocument.BEFORE
+            )
+            if not previous:
+                return jsonify({'error': 'Review not found'}), 404
+
+            delta = update_data.get('rating', previous['rating']) - previous['rating']
+            if delta:
+                _rating_changed(apply_rating_change(id_query(previous['restaurantId']), delta, 0))
+
+            review = {**previous, **update_data}
+            return jsonify({'message': 'Review updated successfully',
+                        'review': parse_json(review)}), 200
+
+        except Exception as e:
+            print(f"Error in update_review: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/reviews/<review_id>', methods=['DELETE'])
+    def delete_review(review_id):
+        try:
+            review = mongo.db.reviews.find_one_and_delete(id_query(review_id))
+            if not review:
+                return jsonify({'error': 'Review not found'}), 404
+
+            _rating_changed(apply_rating_change(id_query(review['restaurantId']), -review['rating'], -1))
+            return jsonify({'message': 'Review deleted successfully'}), 200
+
+        except Exception as e:
+            print(f"Error in delete_review: {str(e)}")
+            return jsonify({'error': str(e)}), 500
@@ -0,0 +1,132 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask import request, jsonify
+from pymongo import ReturnDocument
+from app.config import mongo
+from app.models.utils import parse_json, id_query
+from app.models.s3_utils import get_uploader
+from app.models.uploads import UPLOAD_FIELDS, enqueue_upload_session
+from app.models.admission import limit
+
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_URL_EXPIRES = int(os.getenv('UPLOAD_URL_EXPIRES', '900'))
+UPLOAD_MAX_FILES = 20
+
+def register_routes(app):
+    s3_uploader = get_uploader()
+
+    @app.route('/api/restaurants/<restaurant_id>/uploads', methods=['POST'])
+    def create_upload_session(restaurant_id):
+        try:
+            data = request.get_json() or {}
+            files = data.get('files')
+
+            if not isinstance(files, list) or not files:
+                return jsonify({'error': 'files must be a non-empty list'}), 400
+            if len(files) > UPLOAD_MAX_FILES:
+                return jsonify({'error': f'At most {UPLOAD_MAX_FILES} files per upload'}), 400
+            for file in files:
+                if file.get('field') not in UPLOAD_FIELDS:
+                    return jsonify({'error': f"field must be one of: {', '.join(UPLOAD_FIELDS)}"}), 400
+                if not str(file.get('contentType', '')).startswith('image/'):
+                    return jsonify({'error': 'Only image uploads are accepted'}), 400
+            if sum(1 for file in files if file['field'] == 'logo') > 1:
+                return jsonify({'error': 'Only one logo per upload'}), 400
+
+            restaurant = mongo.db.restaurants.find_one(id_query(restaurant_id), {'name': 1})
+            if not restaurant:
+                return jsonify({'error': 'Restaurant not found'}), 404
+
+            session_files = []
+            uploads = []
+            for file in files:
+                prefix = s3_uploader.restaurant_prefix(restaurant['name'], UPLOAD_FIELDS[file['field']])
+                key = f"{prefix}{uuid.uuid4().hex}"
+                post = s3_uploader.presigned_post(key, file['contentType'], UPLOAD_MAX_BYTES, UPLOAD_URL_EXPIRES)
+                session_files.append({'field': file['field'], 'key': key, 'contentType': file['contentType']})
+                uploads.append({'field': file['field'], 'key': key, 'url': post['url'], 'fields': post['fields']})
+
+            session = {
+                'restaurantId': str(restaurant['_id']),
+                'files': session_files,
+                'status': 'pending',
+                'createdAt': datetime.utcnow(),
+                'expiresAt': datetime.utcnow() + timedelta(seconds=UPLOAD_URL_EXPIRES)
+            }
+            mongo.db.upload_sessions.insert_one(session)
+
+            return jsonify({'sessionId': str(session['_id']),
+                        'expiresIn': UPLOAD_URL_EXPIRES,
+                        'uploads': uploads}), 201
+
+        except Exception as e:
+            print(f"Error in create_upload_session: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/uploads/<session_id>/confirm', methods=['POST'])
+    @limit('upload-confirm',
+           max_concurrent=app.config['WRITE_MAX_CONCURRENT'],
+           rate=app.config['WRITE_RATE'],
+           burst=app.config['WRITE_BURST'])
+    def confirm_upload_session(session_id):
+        session = None
+        try:
+            if not ObjectId.is_valid(session_id):
+                return jsonify({'error': 'Upload session not found'}), 404
+
+            # Claim the session so a repeated confirm cannot attach files twice
+            session = mongo.db.upload_sessions.find_one_and_update(
+                {'_id': ObjectId(session_id), 'status': {'$in': ['pending', 'failed']}},
+                {'$set': {'status': 'confirming'}},
+                return_document=ReturnDocument.AFTER
+            )
+            if not session:
+                return jsonify({'error': 'Upload session not found or already confirmed'}), 404
+
+            # Every object has to be there before anything is attached
+            missing = [f['key'] for f in session['files'] if not s3_uploader.object_exists(f['key'])]
+            if missing:
+                mongo.db.upload_sessions.update_one({'_id': session['_id']}, {'$set': {'status': 'pending'}})
+                return jsonify({'error': 'Some files were not uploaded', 'missing': missing}), 400
+
+            # Compression and attaching happen off the request path
+            mongo.db.upload_sessions.update_one(
+                {'_id': session['_id']},
+                {'$set': {'status': 'queued', 'queuedAt': datetime.utcnow()}, '$unset': {'error': ''}}
+            )
+            enqueue_upload_session(session['_id'])
+
+            return jsonify({'message': 'Upload queued for processing',
+                        'sessionId': session_id,
+                        'status': 'queued'}), 202
+
+        except Exception as e:
+            print(f"Error in confirm_upload_session: {str(e)}")
+            if session:
+                # Let the client confirm again instead of leaving the session claimed
+                mongo.db.upload_sessions.update_one(
+                    {'_id': session['_id'], 'status': 'confirming'},
+                    {'$set': {'status': 'pending'}}
+                )
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/uploads/<session_id>', methods=['GET'])
+    def get_upload_session(session_id):
+        try:
+            if not ObjectId.is_valid(session_id):
+                return jsonify({'error': 'Upload session not found'}), 404
+
+            session = mongo.db.upload_sessions.find_one(
+                {'_id': ObjectId(session_id)},
+                {'restaurantId': 1, 'status': 1, 'error': 1, 'urls': 1}
+            )
+            if not session:
+                return jsonify({'error': 'Upload session not found'}), 404
+
+            return jsonify(parse_json(session)), 200
+
+        except Exception as e:
+            print(f"Error in get_upload_session: {str(e)}")
+            return jsonify({'error': str(e)}), 500
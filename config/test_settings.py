@@ -0,0 +1,12 @@
+from .settings import *
+
+# Tests run without a .env
+SECRET_KEY = SECRET_KEY or 'test-secret-key'
+
+# Every test run starts from a private response cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'findnbite-api-tests',
+    }
+}
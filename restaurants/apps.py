@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+class RestaurantsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'restaurants'
+
+    def ready(self):
+        # Connect cache invalidation handlers
+        from . import signals  # noqa: F401
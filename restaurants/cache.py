@@ -0,0 +1,70 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+def _cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+def _version_key(scope):
+    return f"api:{scope}:version"
+
+def get_version(scope):
+    """
+    Current version of a cache scope. A missing version (never set or evicted)
+    starts from the clock so it can never collide with an older one.
+    """
+    cache = _cache()
+    version = cache.get(_version_key(scope))
+    if version is None:
+        cache.add(_version_key(scope), time.time_ns(), None)
+        version = cache.get(_version_key(scope))
+    return version
+
+def invalidate(scope):
+    """Make every entry stored under a scope unreachable"""
+    cache = _cache()
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        cache.set(_version_key(scope), time.time_ns(), None)
+
+def list_scope(namespace):
+    return f"{namespace}:list"
+
+def detail_scope(namespace, pk):
+    return f"{namespace}:{pk}"
+
+def _response_key(scope, request):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"api:{scope}:{get_version(scope)}:{url}"
+
+class CachedResponseMixin:
+    """
+    Cache serialized list and detail responses of a viewset. Entries are keyed
+    by a per-scope version that signal handlers bump on writes, so a hit
+    touches neither the database nor the serializers.
+    """
+    cache_namespace = None
+
+    def _cached(self, scope, request, render):
+        key = _response_key(scope, request)
+        data = _cache().get(key)
+        if data is not None:
+            return Response(data)
+        response = render()
+        if response.status_code == 200:
+            _cache().set(key, response.data, getattr(settings, 'API_CACHE_TIMEOUT', 300))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        parent = super()
+        return self._cached(list_scope(self.cache_namespace), request,
+                            lambda: parent.list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super()
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self._cached(detail_scope(self.cache_namespace, pk), request,
+                            lambda: parent.retrieve(request, *args, **kwargs))
@@ -1,6 +1,25 @@
 from rest_framework import serializers
 from .models import Restaurant, Hashtag, RestaurantImage, MenuImage
 
+def requested_fields(request):
+    """Return the set of fields in the `fields` query parameter, or None for all"""
+    if request is None:
+        return None
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+class SparseFieldsetMixin:
+    """Only serialize the fields listed in the `fields` query parameter"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
 class HashtagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Hashtag
@@ -16,11 +35,11 @@ class MenuImageSerializer(serializers.ModelSerializer):
         model = MenuImage
         fields = ('image',)
 
-class RestaurantSerializer(serializers.ModelSerializer):
+class RestaurantSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     hashtags = HashtagSerializer(many=True, read_only=True)
     images = RestaurantImageSerializer(many=True, read_only=True)
     menu_images = MenuImageSerializer(many=True, read_only=True)
 
     class Meta:
         model = Restaurant
-        fields = '__all__' 
\ No newline at end of file
+        fields = '__all__'
@@ -0,0 +1,50 @@
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .cache import invalidate, list_scope, detail_scope
+from .models import Restaurant, Hashtag, RestaurantImage, MenuImage
+
+def invalidate_restaurants(pks):
+    """Drop cached restaurant lists and the details of the given restaurants"""
+    invalidate(list_scope('restaurant'))
+    for pk in pks:
+        invalidate(detail_scope('restaurant', pk))
+
+def _hashtag_restaurant_pks(hashtag):
+    return list(hashtag.restaurant_set.values_list('pk', flat=True))
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def restaurant_changed(sender, instance, **kwargs):
+    invalidate_restaurants([instance.pk])
+
+@receiver([post_save, post_delete], sender=RestaurantImage)
+@receiver([post_save, post_delete], sender=MenuImage)
+def restaurant_image_changed(sender, instance, **kwargs):
+    invalidate_restaurants([instance.restaurant_id])
+
+@receiver(pre_delete, sender=Hashtag)
+def hashtag_deleting(sender, instance, **kwargs):
+    # The relation rows are gone by post_delete, remember who embeds the hashtag
+    instance._restaurant_pks = _hashtag_restaurant_pks(instance)
+
+@receiver([post_save, post_delete], sender=Hashtag)
+def hashtag_changed(sender, instance, **kwargs):
+    invalidate(list_scope('hashtag'))
+    invalidate(detail_scope('hashtag', instance.pk))
+    # Restaurants embed their hashtags
+    pks = getattr(instance, '_restaurant_pks', None)
+    invalidate_restaurants(pks if pks is not None else _hashtag_restaurant_pks(instance))
+
+@receiver(m2m_changed, sender=Restaurant.hashtags.through)
+def restaurant_hashtags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # clear() does not report the affected restaurants
+        instance._restaurant_pks = _hashtag_restaurant_pks(instance)
+        return
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_restaurants([instance.pk])
+    elif action == 'post_clear':
+        invalidate_restaurants(getattr(instance, '_restaurant_pks', []))
+    else:
+        invalidate_restaurants(pk_set or [])
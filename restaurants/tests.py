@@ -0,0 +1,164 @@
+from django.core.cache import caches
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from .models import Restaurant, Hashtag, RestaurantImage, MenuImage
+
+class RestaurantListQueryTests(TestCase):
+    """The list endpoint runs a fixed number of queries, whatever the page size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        hashtags = [Hashtag.objects.create(name=f'tag{i}') for i in range(3)]
+        for i in range(30):
+            restaurant = Restaurant.objects.create(
+                name=f'Restaurant {i}',
+                phone='0000',
+                short_location='Center',
+                description='Description',
+                price_range='$$',
+                url='https://example.com'
+            )
+            restaurant.hashtags.set(hashtags)
+            RestaurantImage.objects.create(restaurant=restaurant, image=f'restaurants/images/{i}.jpg')
+            MenuImage.objects.create(restaurant=restaurant, image=f'restaurants/menus/{i}.jpg')
+
+    def setUp(self):
+        # Responses are cached, every request has to reach the database
+        caches[settings.API_CACHE_ALIAS].clear()
+
+    def assertListQueries(self, num, query):
+        with self.assertNumQueries(num):
+            response = self.client.get(f'/api/restaurants/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_full_representation(self):
+        # Restaurants plus one prefetch each for hashtags, images and menu images
+        for page_size in (5, 25):
+            with self.subTest(page_size=page_size):
+                results = self.assertListQueries(4, f'page_size={page_size}')
+                self.assertEqual(len(results), page_size)
+                self.assertEqual(len(results[0]['hashtags']), 3)
+                self.assertEqual(len(results[0]['images']), 1)
+
+    def test_sparse_fieldset_skips_unrequested_relations(self):
+        for page_size in (5, 25):
+            with self.subTest(page_size=page_size):
+                results = self.assertListQueries(1, f'page_size={page_size}&fields=id,name')
+                self.assertEqual(len(results), page_size)
+                self.assertEqual(set(results[0]), {'id', 'name'})
+
+    def test_sparse_fieldset_prefetches_requested_relations(self):
+        for page_size in (5, 25):
+            with self.subTest(page_size=page_size):
+                results = self.assertListQueries(2, f'page_size={page_size}&fields=id,hashtags')
+                self.assertEqual(set(results[0]), {'id', 'hashtags'})
+                self.assertEqual(len(results[0]['hashtags']), 3)
+
+
+class ResponseCacheInvalidationTests(TestCase):
+    """Writes drop exactly the cached responses that embed the changed rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag1 = Hashtag.objects.create(name='tag1')
+        cls.tag2 = Hashtag.objects.create(name='tag2')
+        cls.a, cls.b, cls.c = [
+            Restaurant.objects.create(
+                name=f'Restaurant {name}',
+                phone='0000',
+                short_location='Center',
+                description='Description',
+                price_range='$$',
+                url='https://example.com'
+            )
+            for name in 'abc'
+        ]
+        cls.a.hashtags.add(cls.tag1)
+        cls.b.hashtags.add(cls.tag2)
+
+    def setUp(self):
+        caches[settings.API_CACHE_ALIAS].clear()
+        self.urls = {
+            'list': '/api/restaurants/',
+            'a': f'/api/restaurants/{self.a.pk}/',
+            'b': f'/api/restaurants/{self.b.pk}/',
+            'c': f'/api/restaurants/{self.c.pk}/',
+            'hashtags': '/api/hashtags/',
+        }
+        for url in self.urls.values():
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def assertCached(self, *names):
+        for name in names:
+            with self.subTest(cached=name), self.assertNumQueries(0):
+                self.client.get(self.urls[name])
+
+    def assertNotCached(self, *names):
+        for name in names:
+            with self.subTest(invalidated=name), CaptureQueriesContext(connection) as queries:
+                self.client.get(self.urls[name])
+            self.assertGreater(len(queries), 0)
+
+    def test_hits_run_no_queries(self):
+        self.assertCached('list', 'a', 'b', 'c', 'hashtags')
+
+    def test_restaurant_save(self):
+        self.a.name = 'Renamed'
+        self.a.save()
+        self.assertNotCached('list', 'a')
+        self.assertCached('b', 'c', 'hashtags')
+
+    def test_restaurant_delete(self):
+        self.a.delete()
+        self.assertNotCached('list')
+        self.assertCached('b', 'c', 'hashtags')
+
+    def test_restaurant_image_save_and_delete(self):
+        image = RestaurantImage.objects.create(restaurant=self.a, image='restaurants/images/a.jpg')
+        self.assertNotCached('list', 'a')
+        self.assertCached('b', 'c')
+
+        image.delete()
+        self.assertNotCached('list', 'a')
+        self.assertCached('b', 'c')
+
+    def test_menu_image_save_and_delete(self):
+        image = MenuImage.objects.create(restaurant=self.b, image='restaurants/menus/b.jpg')
+        self.assertNotCached('list', 'b')
+        self.assertCached('a', 'c')
+
+        image.delete()
+        self.assertNotCached('list', 'b')
+        self.assertCached('a', 'c')
+
+    def test_hashtag_rename_invalidates_embedding_restaurants(self):
+        self.tag1.name = 'renamed'
+        self.tag1.save()
+        self.assertNotCached('hashtags', 'list', 'a')
+        self.assertCached('b', 'c')
+
+    def test_hashtag_delete_invalidates_embedding_restaurants(self):
+        self.tag2.delete()
+        self.assertNotCached('hashtags', 'list', 'b')
+        self.assertCached('a', 'c')
+
+    def test_m2m_add_and_remove(self):
+        self.c.hashtags.add(self.tag1)
+        self.assertNotCached('list', 'c')
+        self.assertCached('a', 'b', 'hashtags')
+
+        self.c.hashtags.remove(self.tag1)
+        self.assertNotCached('list', 'c')
+        self.assertCached('a', 'b')
+
+    def test_reverse_m2m_add_and_clear(self):
+        self.tag2.restaurant_set.add(self.c)
+        self.assertNotCached('list', 'c')
+        self.assertCached('a', 'b')
+
+        self.tag2.restaurant_set.clear()
+        self.assertNotCached('list', 'b', 'c')
+        self.assertCached('a')
@@ -1,14 +1,39 @@
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from .cache import CachedResponseMixin
 from .models import Restaurant, Hashtag
-from .serializers import RestaurantSerializer, HashtagSerializer
+from .pagination import RestaurantCursorPagination
+from .serializers import RestaurantSerializer, HashtagSerializer, requested_fields
 
-class RestaurantViewSet(viewsets.ModelViewSet):
+class RestaurantViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = 'restaurant'
     queryset = Restaurant.objects.all()
     serializer_class = RestaurantSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = RestaurantCursorPagination
+    # Nested relations, each loaded with one query per page when requested
+    prefetch_fields = ('hashtags', 'images', 'menu_images')
 
-class HashtagViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        fields = requested_fields(self.request)
+        prefetch = [name for name in self.prefetch_fields if fields is None or name in fields]
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+
+        # Filter by hashtag id or name
+        hashtag = self.request.query_params.get('hashtag')
+        if hashtag:
+            if hashtag.isdigit():
+                queryset = queryset.filter(hashtags__id=hashtag)
+            else:
+                queryset = queryset.filter(hashtags__name=hashtag)
+
+        return queryset
+
+class HashtagViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = 'hashtag'
     queryset = Hashtag.objects.all()
     serializer_class = HashtagSerializer
-    permission_classes = [IsAuthenticatedOrReadOnly] 
\ No newline at end of file
+    permission_classes = [IsAuthenticatedOrReadOnly]